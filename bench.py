@@ -0,0 +1,227 @@
+import argparse
+import json
+import os
+import platform
+import random
+import subprocess
+import sys
+import tempfile
+import time
+from typing import Callable, Dict, Iterator, List, Optional, Set, Tuple
+
+from cfg import CFG, render
+
+Productions = Dict[str, Set[str]]
+
+
+# grammar generators: each returns (initial symbol, productions)
+
+def expression(levels: int) -> Tuple[str, Productions]:
+    # E0 -> E1 E0', E0' -> o0 E1 E0' | &, ..., with one binary operator
+    # per precedence level and parentheses at the bottom
+    productions = {}
+    for i in range(levels):
+        productions[f'E{i}'] = {f"E{i + 1} E{i}'"}
+        productions[f"E{i}'"] = {f"o{i} E{i + 1} E{i}'", '&'}
+    productions[f'E{levels}'] = {'( E0 )', 'id'}
+    return 'E0', productions
+
+
+def wide(n: int) -> Tuple[str, Productions]:
+    # a single nonterminal choosing between n alternatives
+    return 'S', {
+        'S': {f't{i} A' for i in range(n)},
+        'A': {'x', '&'},
+    }
+
+
+def nullable_chain(depth: int) -> Tuple[str, Productions]:
+    # N0 -> N1 b0 | &, N1 -> N2 b1 | &, ...: every nonterminal is
+    # nullable and first/follow flow through the whole chain
+    productions = {f'N{i}': {f'N{i + 1} b{i}', '&'} for i in range(depth)}
+    productions[f'N{depth}'] = {'a', '&'}
+    productions['S'] = {'N0 end'}
+    return 'S', productions
+
+
+def random_ll1(n: int, seed: int = 0) -> Tuple[str, Productions]:
+    # every alternative starts with a terminal of its own, so the grammar
+    # is LL(1); bodies only refer to later nonterminals, so it is fertile
+    rng = random.Random(seed)
+    productions = {}
+    for i in range(n):
+        later = [f'R{j}' for j in range(i + 1, min(n, i + 8))]
+        productions[f'R{i}'] = {
+            ' '.join([f'r{i}_{k}'] + [rng.choice(later + ['x', 'y']) for _ in range(rng.randint(0, 3))])
+            for k in range(rng.randint(1, 4))
+        }
+    return 'R0', productions
+
+
+GENERATORS = {
+    'expression': (expression, [4, 16, 64]),
+    'wide': (wide, [64, 512, 4096]),
+    'nullable_chain': (nullable_chain, [64, 512, 2048]),
+    'random_ll1': (random_ll1, [64, 512, 2048]),
+}
+
+
+def expression_sentence(levels: int, length: int, seed: int = 0) -> str:
+    # a sentence of the expression grammar with about length tokens
+    rng = random.Random(seed)
+    tokens, depth = [], 0
+    while True:
+        while len(tokens) < length and rng.random() < 0.1:
+            tokens.append('(')
+            depth += 1
+
+        tokens.append('id')
+        while depth and (len(tokens) >= length or rng.random() < 0.3):
+            tokens.append(')')
+            depth -= 1
+
+        if len(tokens) >= length:
+            return ' '.join(tokens)
+
+        tokens.append(f'o{rng.randrange(levels)}')
+
+
+def measure(setup: Callable[[], object], run: Callable[[object], object], repeat: int) -> float:
+    # best wall time of run over repeat fresh setups
+    best = float('inf')
+    for _ in range(repeat):
+        arg = setup()
+        start = time.perf_counter()
+        run(arg)
+        best = min(best, time.perf_counter() - start)
+    return best
+
+
+def benchmarks(initial: str, productions: Productions) -> Iterator[Tuple[str, Callable, Callable]]:
+    def fresh():
+        return CFG.create(initial, {x: set(p) for x, p in productions.items()})
+
+    lines = render(initial, productions)
+
+    def first_follow(cfg):
+        for x in cfg.nonterminals:
+            cfg.first(x)
+            cfg.follow(x)
+
+    def first_nonterminal(cfg):
+        for x in cfg.nonterminals:
+            cfg.first_nonterminal(x)
+
+    yield 'load', lambda: lines, CFG.load
+    yield 'first_follow', fresh, first_follow
+    yield 'first_nonterminal', fresh, first_nonterminal
+    yield 'is_ll1', fresh, CFG.is_ll1
+    yield 'parse_table', fresh, CFG.parse_table
+    yield 'lalr_table', fresh, CFG.lalr_table
+    yield 'epsilon_free', fresh, CFG.epsilon_free
+    yield 'without_infertile', fresh, CFG.without_infertile
+    yield 'reduced', fresh, CFG.reduced
+
+
+def run(
+    generators: Optional[List[str]] = None,
+    lengths: Tuple[int, ...] = (100, 1000, 10000),
+    repeat: int = 3,
+    log: Callable[[str], None] = lambda line: None,
+) -> Dict[str, float]:
+    results = {}
+
+    for name in generators or GENERATORS:
+        generate, sizes = GENERATORS[name]
+        for size in sizes:
+            initial, productions = generate(size)
+            for bench, setup, fn in benchmarks(initial, productions):
+                key = f'{name}/{size}/{bench}'
+                results[key] = measure(setup, fn, repeat)
+                log(f'{key:<40} {results[key] * 1000:10.3f} ms')
+
+    # parsing is linear in the input, so it runs on growing sentences; the
+    # trace is only recorded, as replaying every step copies the input left
+    levels = 8
+    cfg = CFG.create(*expression(levels))
+    cfg.compiled_table()
+    for length in lengths:
+        sentence = expression_sentence(levels, length)
+        for bench, fn in (('parse', cfg.trace), ('recognize', cfg.recognize)):
+            key = f'expression/{levels}/{bench}/{length}'
+            results[key] = measure(lambda: sentence, fn, repeat)
+            log(f'{key:<40} {results[key] * 1000:10.3f} ms')
+
+    # cold start of the command line, interpreter included
+    with tempfile.TemporaryDirectory() as directory:
+        path = os.path.join(directory, 'expression.cfg')
+        with open(path, 'w') as f:
+            f.write('\n'.join(render(*expression(levels))))
+
+        command = [sys.executable, '-m', 'cfg', 'll1', path]
+        here = os.path.dirname(os.path.abspath(__file__))
+        key = 'startup/cli'
+        results[key] = measure(
+            lambda: command,
+            lambda command: subprocess.run(command, cwd=here, stdout=subprocess.DEVNULL, check=True),
+            repeat,
+        )
+        log(f'{key:<40} {results[key] * 1000:10.3f} ms')
+
+    return results
+
+
+def compare(
+    results: Dict[str, float],
+    baseline: Dict[str, float],
+    threshold: float = 0.25,
+    floor: float = 1e-3,
+) -> List[Tuple[str, float, float]]:
+    # (key, baseline, result) of each benchmark more than threshold slower
+    # than its baseline; timings below floor seconds are noise
+    return [
+        (key, baseline[key], t)
+        for key, t in results.items()
+        if key in baseline and t > baseline[key] * (1 + threshold) and t - baseline[key] > floor
+    ]
+
+
+def main(argv: Optional[List[str]] = None) -> int:
+    parser = argparse.ArgumentParser(description='Times the grammar operations on synthetic grammars.')
+    parser.add_argument('-o', '--output', help='write results as JSON to this file')
+    parser.add_argument('-b', '--baseline', help='compare against results saved with --output')
+    parser.add_argument('-t', '--threshold', type=float, default=0.25,
+                        help='relative slowdown reported as a regression (default: 0.25)')
+    parser.add_argument('-r', '--repeat', type=int, default=3, help='runs per benchmark, best is kept')
+    parser.add_argument('-g', '--generator', action='append', choices=sorted(GENERATORS),
+                        help='only run this generator (can be repeated)')
+    parser.add_argument('-l', '--lengths', type=int, nargs='+', default=[100, 1000, 10000],
+                        help='sentence lengths for the parse benchmark')
+    args = parser.parse_args(argv)
+
+    results = run(args.generator, tuple(args.lengths), args.repeat, log=print)
+
+    if args.output:
+        with open(args.output, 'w') as f:
+            json.dump({
+                'python': platform.python_version(),
+                'machine': platform.machine(),
+                'results': results,
+            }, f, indent=2, sort_keys=True)
+
+    if args.baseline:
+        with open(args.baseline) as f:
+            baseline = json.load(f)['results']
+
+        regressions = compare(results, baseline, args.threshold)
+        for key, before, after in regressions:
+            print(f'REGRESSION {key}: {before * 1000:.3f} ms -> {after * 1000:.3f} ms '
+                  f'({after / before:.2f}x)')
+        if regressions:
+            return 1
+
+    return 0
+
+
+if __name__ == '__main__':
+    sys.exit(main())
@@ -1,242 +1,1641 @@
 import logging
+import mmap
+import os
+import re
 import string
-from itertools import chain
-from typing import Dict, NamedTuple, Set, Tuple, TextIO
+import sys
+import threading
+import time
+from array import array
+from collections import deque
+from contextlib import contextmanager, nullcontext
+from itertools import chain, islice, repeat
+from typing import (
+    Any, Callable, Dict, Iterable, Iterator, List, NamedTuple, Optional, Set,
+    Tuple, TextIO, Union,
+)
 
 logger = logging.getLogger(__name__)
 
 
-class CFG(NamedTuple):
-    initial_symbol: str
-    productions: Dict[str, Set[str]]
-    nonterminals: Set[str]
-    terminals: Set[str]
+class PhaseStats:
+    __slots__ = ('calls', 'time', 'unions')
+
+    def __init__(self):
+        self.calls = 0
+        self.time = 0.0
+        self.unions = 0
+
+    def __repr__(self):
+        return f'<PhaseStats calls={self.calls} time={self.time:.6f} unions={self.unions}>'
+
+
+class Report:
+    # what ran under instrument(): calls, wall time and set unions (during
+    # propagation) per phase, where a phase's time includes the phases it
+    # runs; the deepest graph traversal; and the work of the parsers
+    __slots__ = ('phases', 'active', 'depth', 'tokens', 'steps', 'expansions')
+
+    def __init__(self):
+        self.phases = {}
+        self.active = []
+        self.depth = 0
+        self.tokens = 0
+        self.steps = 0
+        self.expansions = 0
+
+    @contextmanager
+    def timing(self, name: str) -> Iterator[PhaseStats]:
+        stats = self.phases.setdefault(name, PhaseStats())
+        stats.calls += 1
+        self.active.append(stats)
+        start = time.perf_counter()
+        try:
+            yield stats
+        finally:
+            stats.time += time.perf_counter() - start
+            self.active.pop()
+
+    def unions(self, count: int):
+        if self.active:
+            self.active[-1].unions += count
+
+    def parsed(self, tokens: int, expansions: int):
+        self.tokens += tokens
+        self.expansions += expansions
+        self.steps += tokens + expansions
+
+    @property
+    def expansions_per_token(self) -> float:
+        return self.expansions / self.tokens if self.tokens else 0.0
+
+    def summary(self) -> str:
+        parts = [f'{name} {stats.time * 1000:.1f} ms' for name, stats in self.phases.items()]
+        if self.tokens:
+            parts.append(f'{self.tokens} tokens, {self.expansions_per_token:.2f} expansions/token')
+        return ', '.join(parts)
 
-    def first(self, sentence: str, visited=set()) -> Set[str]:
-        first = set()
-        visited |= {sentence}
+    def __str__(self):
+        lines = [f"{'phase':<16}{'calls':>8}{'time (ms)':>12}{'unions':>10}"]
+        for name, stats in self.phases.items():
+            lines.append(f'{name:<16}{stats.calls:>8}{stats.time * 1000:>12.3f}{stats.unions:>10}')
+        lines.append(f'deepest traversal: {self.depth}')
+        lines.append(f'parser: {self.tokens} tokens, {self.steps} steps, {self.expansions} expansions')
+        return '\n'.join(lines)
+
+
+_state = threading.local()
+_untimed = nullcontext()
+
+
+@contextmanager
+def instrument() -> Iterator[Report]:
+    # records what runs on this thread into the yielded report
+    previous = getattr(_state, 'report', None)
+    _state.report = report = Report()
+    try:
+        yield report
+    finally:
+        _state.report = previous
+
+
+def _report() -> Optional[Report]:
+    return getattr(_state, 'report', None)
+
+
+def _phase(name: str):
+    report = getattr(_state, 'report', None)
+    return _untimed if report is None else report.timing(name)
+
+
+def _components(nodes: Iterable[str], edges: Dict[str, Set[str]]) -> List[List[str]]:
+    # strongly connected components (iterative tarjan), each one listed
+    # after every component reachable from it
+    return list(_iter_components(nodes, edges))
+
+
+def _iter_components(nodes: Iterable[str], edges: Dict[str, Set[str]]) -> Iterator[List[str]]:
+    # as _components, each one given as soon as it is complete, so callers
+    # looking for one in particular can stop there
+    index, low = {}, {}
+    stack, on_stack = [], set()
+    depth = 0
+
+    for root in nodes:
+        if root in index:
+            continue
+
+        index[root] = low[root] = len(index)
+        stack.append(root)
+        on_stack.add(root)
+        work = [(root, iter(edges[root]))]
+
+        while work:
+            v, children = work[-1]
+            for w in children:
+                if w not in index:
+                    index[w] = low[w] = len(index)
+                    stack.append(w)
+                    on_stack.add(w)
+                    work.append((w, iter(edges[w])))
+                    if len(work) > depth:
+                        depth = len(work)
+                    break
+
+                if w in on_stack:
+                    low[v] = min(low[v], index[w])
+
+            else:
+                work.pop()
+                if work:
+                    u = work[-1][0]
+                    low[u] = min(low[u], low[v])
+
+                if low[v] == index[v]:
+                    component = []
+                    while True:
+                        w = stack.pop()
+                        on_stack.discard(w)
+                        component.append(w)
+                        if w == v:
+                            break
+                    yield component
+
+    report = _report()
+    if report is not None:
+        report.depth = max(report.depth, depth)
+
+
+def _propagate(sets: Dict[int, int], edges: Dict[int, Set[int]]):
+    # least fixed point of sets[x] |= sets[y] for every edge y -> x, over
+    # bitsets: visit components in topological order, so every member of a
+    # component ends up with the same set and each edge is crossed once
+    components = _components(sets, edges)
+    for component in reversed(components):
+        if len(component) > 1:
+            merged = 0
+            for x in component:
+                merged |= sets[x]
+            for x in component:
+                sets[x] = merged
+            members = set(component)
+        else:
+            merged, members = sets[component[0]], component
+
+        for x in component:
+            for y in edges[x]:
+                if y not in members:
+                    sets[y] |= merged
+
+    report = _report()
+    if report is not None:
+        # counted afterwards, to keep the loop above untouched
+        unions = 0
+        for component in components:
+            members = set(component)
+            unions += len(component) if len(component) > 1 else 0
+            unions += sum(y not in members for x in component for y in edges[x])
+        report.unions(unions)
+
+
+def _mask(ids: Iterable[int]) -> int:
+    # bitset of ids: bit i is set for each id i
+    mask = 0
+    for i in ids:
+        mask |= 1 << i
+    return mask
+
+
+_ONE = re.compile('1')
+
+
+def _bits(mask: int) -> List[int]:
+    # ids in a bitset, lowest first: the first few are picked off one by
+    # one, which is cheapest for the usual sparse sets, and what is left
+    # of a larger set is found among its binary digits
+    ids = []
+    while mask and len(ids) < 8:
+        low = mask & -mask
+        ids.append(low.bit_length() - 1)
+        mask ^= low
+    if mask:
+        ids += [m.start() for m in _ONE.finditer(bin(mask)[:1:-1])]
+    return ids
+
+
+def _closure(roots: Set[str], edges: Dict[str, Set[str]]) -> Set[str]:
+    # everything reachable from roots through edges
+    reached, worklist = set(roots), list(roots)
+    while worklist:
+        for y in edges.get(worklist.pop(), ()):
+            if y not in reached:
+                reached.add(y)
+                worklist.append(y)
+    return reached
+
+
+_worker_table = None
+
+
+def _variants(body: Tuple[int, ...], nullable: Set[int]) -> Set[Tuple[int, ...]]:
+    # body with each subset of its nullable symbols left out; prefixes are
+    # kept in a set as they grow, so a run of k copies of the same nullable
+    # symbol gives k + 1 of them rather than 2^k repeating ones
+    variants = {()}
+    for y in body:
+        if y in nullable:
+            variants |= {v + (y,) for v in variants}
+        else:
+            variants = {v + (y,) for v in variants}
+    return variants
+
+
+def _init_worker(table: 'CompiledTable'):
+    global _worker_table
+    _worker_table = table
+
+
+def _check_shard(sentences: List[Union[str, List[str]]]) -> List['ParseResult']:
+    return [
+        _worker_table.check(s.split() if isinstance(s, str) else s)
+        for s in sentences
+    ]
+
+
+def _chunks(iterable: Iterable, size: int) -> Iterator[list]:
+    iterator = iter(iterable)
+    while True:
+        chunk = list(islice(iterator, size))
+        if not chunk:
+            return
+        yield chunk
+
+
+def tokenize(fp: TextIO, chunk_size: int = 1 << 16) -> Iterator[str]:
+    # whitespace separated tokens of a text stream, read chunk by chunk
+    rest = ''
+    while True:
+        chunk = fp.read(chunk_size)
+        if not chunk:
+            break
+
+        chunk = rest + chunk
+        words = chunk.split()
+        rest = words.pop() if words and not chunk[-1].isspace() else ''
+        yield from words
+
+    if rest:
+        yield rest
+
+
+def render(initial_symbol: str, productions: Dict[str, Set[str]]) -> List[str]:
+    # lines as read by CFG.load, initial symbol first
+    order = [initial_symbol] + sorted(productions.keys() - {initial_symbol})
+    return [f"{x} -> {' | '.join(sorted(productions[x]))}" for x in order]
+
+
+class Diagnostic(NamedTuple):
+    source: str
+    line: int
+    message: str
+
+    def __str__(self):
+        return f'{self.source}:{self.line}: {self.message}'
+
+
+class Diagnostics:
+    # problems found while loading a grammar: the first `limit` are kept,
+    # the others only counted
+    __slots__ = ('limit', 'entries', 'count')
+
+    def __init__(self, limit: int = 100):
+        self.limit = limit
+        self.entries = []
+        self.count = 0
+
+    def add(self, source: str, line: int, message: str):
+        self.count += 1
+        if len(self.entries) < self.limit:
+            self.entries.append(Diagnostic(source, line, message))
+
+    def extend(self, other: 'Diagnostics'):
+        for entry in other.entries:
+            self.add(*entry)
+        self.count += other.dropped
+
+    @property
+    def dropped(self) -> int:
+        return self.count - len(self.entries)
+
+    def log(self):
+        for entry in self.entries:
+            logger.warning('%s', entry)
+        if self.dropped:
+            logger.warning('%d more problems not shown', self.dropped)
+
+    def __iter__(self) -> Iterator[Diagnostic]:
+        return iter(self.entries)
+
+    def __len__(self):
+        return len(self.entries)
+
+    def __repr__(self):
+        return f'<Diagnostics count={self.count} dropped={self.dropped}>'
+
+
+def _mapped_lines(path: str) -> Iterator[str]:
+    # lines of a file, memory-mapped and decoded one line at a time
+    with open(path, 'rb') as f:
+        if os.fstat(f.fileno()).st_size == 0:
+            return
+
+        with mmap.mmap(f.fileno(), 0, access=mmap.ACCESS_READ) as buf:
+            start, end = 0, len(buf)
+            while start < end:
+                stop = buf.find(b'\n', start)
+                if stop < 0:
+                    stop = end
+                yield buf[start:stop].decode()
+                start = stop + 1
+
+
+def _scan(
+    lines: Iterable[str],
+    source: str,
+    diagnostics: Diagnostics,
+) -> Tuple[Optional[str], list]:
+    # first head of the file and its segments: dicts of rules, in file
+    # order, split by the (line, path) of each include directive
+    initial, productions = None, {}
+    segments = [productions]
+
+    for n, line in enumerate(lines, 1):
+        line = line.strip()
+        if not line:
+            continue
+
+        if '->' not in line:
+            directive, _, path = line.partition(' ')
+            if directive == 'include' and path.strip():
+                productions = {}
+                segments += [(n, path.strip().strip('"')), productions]
+            else:
+                diagnostics.add(source, n, 'invalid line, skipping')
+            continue
+
+        x, _, y = line.partition('->')
+        x = x.strip()
+        if not x:
+            diagnostics.add(source, n, 'invalid symbol, skipping')
+            continue
+
+        if '->' in y:
+            diagnostics.add(source, n, 'invalid productions, skipping')
+            continue
+
+        if initial is None:
+            initial = x
+
+        # one string per alternative, stripped in bulk
+        y = set(map(str.strip, y.split('|')))
+        if '' in y:
+            y.discard('')
+            diagnostics.add(source, n, 'empty production, skipping')
+
+        if not y:
+            diagnostics.add(source, n, 'symbol with no productions, skipping')
+            continue
+
+        productions[x] = y
+
+    return initial, segments
+
+
+def _expand(
+    lines: Iterable[str],
+    source: str,
+    seen: frozenset,
+    diagnostics: Diagnostics,
+    files: List[str],
+    processes: Optional[int] = None,
+) -> Tuple[Optional[str], Dict[str, Set[str]]]:
+    # rules of a grammar file with its includes spliced in where they
+    # appear, later rules for a symbol replacing earlier ones; included
+    # files are resolved against the including one, added to files, and
+    # only give the initial symbol when the including file has no rules
+    initial, segments = _scan(lines, source, diagnostics)
+    directory = os.path.dirname(source)
+
+    includes = {}
+    for i, segment in enumerate(segments):
+        if isinstance(segment, dict):
+            continue
+
+        n, path = segment
+        path = os.path.realpath(os.path.join(directory, path))
+        if path in seen:
+            diagnostics.add(source, n, f'circular include of {path}, skipping')
+        elif not os.path.isfile(path):
+            diagnostics.add(source, n, f'cannot include {path}, skipping')
+        else:
+            includes[i] = path
+
+    args = (includes.values(), repeat(seen), repeat(diagnostics.limit))
+    if processes and len(includes) > 1:
+        from concurrent.futures import ProcessPoolExecutor
+        with ProcessPoolExecutor(max_workers=processes) as executor:
+            parts = dict(zip(includes, executor.map(_load_part, *args)))
+    else:
+        parts = dict(zip(includes, map(_load_part, *args)))
+
+    if len(segments) == 1:
+        return initial, segments[0]
+
+    productions = {}
+    for i, segment in enumerate(segments):
+        if isinstance(segment, dict):
+            productions.update(segment)
+        elif i in parts:
+            included_initial, included, found, included_files = parts[i]
+            initial = initial or included_initial
+            productions.update(included)
+            diagnostics.extend(found)
+            files.append(includes[i])
+            files.extend(included_files)
+
+    return initial, productions
+
+
+def _load_part(
+    path: str,
+    seen: frozenset,
+    limit: int,
+) -> Tuple[Optional[str], Dict[str, Set[str]], Diagnostics, List[str]]:
+    diagnostics, files = Diagnostics(limit), []
+    try:
+        initial, productions = _expand(_mapped_lines(path), path, seen | {path}, diagnostics, files)
+    except (OSError, UnicodeDecodeError) as e:
+        diagnostics.add(path, 0, f'cannot read: {e}')
+        initial, productions = None, {}
+    return initial, productions, diagnostics, files
+
+
+class Symbols:
+    # symbol names interned to small ints, '$' is always 0; grammars derived
+    # from one another may share ids by extending a copy of the same table
+    __slots__ = ('names', 'ids')
+
+    def __init__(self, names: Iterable[str] = ('$',)):
+        self.names = list(names)
+        self.ids = {x: i for i, x in enumerate(self.names)}
+
+    def intern(self, name: str) -> int:
+        i = self.ids.get(name)
+        if i is None:
+            i = self.ids[name] = len(self.names)
+            self.names.append(name)
+        return i
+
+    def copy(self) -> 'Symbols':
+        return Symbols(self.names)
+
+
+class Productions:
+    # productions with interned symbols: production i is heads[i] ->
+    # bodies[i], a tuple of symbol ids without '&', written sources[i];
+    # rules maps each nonterminal id to the ids of its productions
+    __slots__ = ('symbols', 'initial', 'nonterminals', 'heads', 'bodies', 'sources', 'rules')
+
+    def __init__(self, grammar: 'CFG', symbols: Optional[Symbols] = None):
+        self.symbols = symbols = symbols if symbols is not None else Symbols()
+        intern = symbols.intern
+
+        s = grammar.initial_symbol
+        order = sorted(grammar.nonterminals - {s})
+        if s in grammar.nonterminals:
+            order.insert(0, s)
+
+        self.initial = intern(s)
+        self.nonterminals = {intern(x) for x in order}
+        self.heads = array('i')
+        self.bodies = []
+        self.sources = []
+        self.rules = {}
+
+        for x in order:
+            i = intern(x)
+            rules = self.rules[i] = []
+            for p in sorted(grammar.productions[x]):
+                rules.append(len(self.bodies))
+                self.heads.append(i)
+                self.bodies.append(tuple(intern(y) for y in p.split() if y != '&'))
+                self.sources.append(p)
+
+    def __len__(self):
+        return len(self.bodies)
+
+
+class Analysis:
+    # nullable set and first and follow sets over symbol ids, the latter as
+    # bitsets (ints with bit i set for symbol i), so unions are single int
+    # operations however large the alphabet; '&' is left out of the sets
+    # (nullable tells it) and only added back in the string views, which
+    # are built on first access. first-nt is kept as the
+    # nonterminals each one may start with directly: its closure can be
+    # quadratic in size (think of a long chain), so it is only built whole
+    # when asked for, or once enough symbols were asked for one by one
+    __slots__ = (
+        'symbols', '_nullable', '_first', '_follow', '_direct', '_closed', '_queries', '_decoded', '_views',
+    )
+
+    def __init__(
+        self,
+        symbols: Symbols,
+        nullable: Set[int],
+        first: Dict[int, int],
+        follow: Dict[int, int],
+        direct: Dict[int, Set[int]],
+    ):
+        self.symbols = symbols
+        self._nullable = nullable
+        self._first = first
+        self._follow = follow
+        self._direct = direct
+        self._closed = None
+        self._queries = 0
+        self._decoded = (0, [])
+        self._views = {}
+
+    @property
+    def _first_nt(self) -> Dict[int, int]:
+        if self._closed is None:
+            # first-nt(x) holds first-nt(y) for each y that x starts with
+            starts = {x: set() for x in self._direct}
+            for x, ys in self._direct.items():
+                for y in ys:
+                    starts[y].add(x)
+
+            closed = {x: _mask(ys) for x, ys in self._direct.items()}
+            _propagate(closed, starts)
+            self._closed = closed
+        return self._closed
+
+    def _first_nt_of(self, x: int) -> Set[int]:
+        if self._closed is None:
+            # the whole closure, as bitsets, weighs at most what a few
+            # hundredth of its rows do as sets, and takes less time than
+            # searching them one by one: callers going through many
+            # symbols get it built once
+            self._queries += 1
+            if self._queries * 256 < len(self._direct):
+                return _closure(self._direct[x], self._direct)
+
+        # members of a cycle share one bitset, asked for in a row when going
+        # through the symbols
+        mask = self._first_nt[x]
+        if mask is not self._decoded[0]:
+            self._decoded = mask, _bits(mask)
+        return set(self._decoded[1])
+
+    def _left_recursive(self) -> Iterator[List[int]]:
+        # cycles (strongly connected components) of the starts-with graph
+        return (
+            component
+            for component in _iter_components(self._direct, self._direct)
+            if len(component) > 1 or component[0] in self._direct[component[0]]
+        )
+
+    def _view(self, sets: Dict[int, int], nullable: bool) -> Dict[str, Set[str]]:
+        names = self.symbols.names
+        # members of a cycle share their set, so each one is decoded once
+        decoded: Dict[int, List[str]] = {}
+        view = {}
+        for x, s in sets.items():
+            members = decoded.get(s)
+            if members is None:
+                members = decoded[s] = [names[y] for y in _bits(s)]
+            view[names[x]] = set(members)
+        if nullable:
+            for x in self._nullable:
+                view[names[x]].add('&')
+        return view
+
+    @property
+    def nullable(self) -> Set[str]:
+        if 'nullable' not in self._views:
+            names = self.symbols.names
+            self._views['nullable'] = {names[x] for x in self._nullable}
+        return self._views['nullable']
+
+    @property
+    def first(self) -> Dict[str, Set[str]]:
+        if 'first' not in self._views:
+            self._views['first'] = self._view(self._first, True)
+        return self._views['first']
+
+    @property
+    def follow(self) -> Dict[str, Set[str]]:
+        if 'follow' not in self._views:
+            self._views['follow'] = self._view(self._follow, False)
+        return self._views['follow']
+
+    @property
+    def first_nt(self) -> Dict[str, Set[str]]:
+        if 'first_nt' not in self._views:
+            self._views['first_nt'] = self._view(self._first_nt, True)
+        return self._views['first_nt']
+
+    def _first_of(self, body: Iterable[int]) -> Tuple[int, bool]:
+        first = 0
+
+        for y in body:
+            first_y = self._first.get(y)
 
-        # compute transitive closure of first(yn)
-        for y in sentence.split():
             # first of terminal is itself
-            if y not in self.nonterminals:
-                visited -= {sentence}
-                return first | {y}
+            if first_y is None:
+                return first | 1 << y, False
 
-            first_y = set()
-            for x in self.productions[y]:
-                if x not in visited:
-                    first_y |= self.first(x)
+            first |= first_y
+            if y not in self._nullable:
+                return first, False
 
-            first |= (first_y - {'&'})
+        return first, True
 
-            if '&' not in first_y:
-                visited -= {sentence}
-                return first
+    def first_of(self, symbols: Iterable[str]) -> Set[str]:
+        names, ids = self.symbols.names, self.symbols.ids
+        first = set()
+
+        for y in symbols:
+            if y == '&':
+                continue
 
-        visited -= {sentence}
+            i = ids.get(y)
+            if i is None or i not in self._first:
+                return first | {y}
+
+            first |= {names[t] for t in _bits(self._first[i])}
+            if i not in self._nullable:
+                return first
 
-        # if for never breaks, & in first(yk)
         return first | {'&'}
 
-    def first_nonterminal(self, symbol: str, visited=set()) -> Set[str]:
-        if symbol in self.terminals:
-            return set()
+    def __eq__(self, other):
+        if not isinstance(other, Analysis):
+            return NotImplemented
 
-        if symbol == '&':
-            return {symbol}
+        return (
+            self.nullable == other.nullable
+            and self.first == other.first
+            and self.follow == other.follow
+            and self.first_nt == other.first_nt
+        )
 
-        visited |= {symbol}
+    __hash__ = None
 
-        first = set()
-        if '&' in self.productions[symbol]:
-            first |= {'&'}
+    def __repr__(self):
+        return (f'<Analysis nullable={self.nullable!r} first={self.first!r} '
+                f'follow={self.follow!r} first_nt={self.first_nt!r}>')
 
-        for production in (p.split() for p in self.productions[symbol]):
-            # compute transitive closure of first_nonterminal(yn)
-            for y in production:
-                if y in self.nonterminals:
-                    first |= {y}
 
-                if y in visited:
-                    continue
-                first_y = self.first_nonterminal(y, visited=visited)
-                first |= (first_y - {'&'})
+class AnalysisCache:
+    def __init__(self):
+        self.artifacts = {}
+        self.version = 0
+        self.hits = 0
+        self.misses = 0
 
-                if '&' not in first_y:
-                    break
+    def get(self, key: str, compute: Callable[[], Any]) -> Any:
+        try:
+            value = self.artifacts[key]
+        except KeyError:
+            self.misses += 1
+            value = self.artifacts[key] = compute()
+        else:
+            self.hits += 1
+        return value
 
-            # if for never breaks, & in first(yk)
-            else:
-                first |= {'&'}
+    def peek(self, key: str) -> Any:
+        return self.artifacts.get(key)
 
-        visited -= {symbol}
+    def put(self, key: str, value: Any):
+        self.artifacts[key] = value
 
-        return first
+    def invalidate(self):
+        self.artifacts.clear()
+        self.version += 1
 
-    def follow(self, symbol: str, visited=set()) -> Set[str]:
-        ret = set()
-        visited |= {symbol}
+    # a cache never makes two otherwise equal grammars different
+    def __eq__(self, other):
+        return isinstance(other, AnalysisCache)
 
-        if symbol == self.initial_symbol:
-            ret |= {'$'}
+    __hash__ = None
 
-        for k, v in self.productions.items():
-            for production in (p.split() for p in v):
-                piece = production
-                while symbol in piece:
-                    piece = piece[production.index(symbol) + 1:]
+    def __repr__(self):
+        return (f'<AnalysisCache version={self.version} '
+                f'hits={self.hits} misses={self.misses}>')
 
-                    for y in piece:
-                        first = self.first(y)#, visited=visited | {y})
-                        ret |= (first - {'&'})
 
-                        if '&' not in first:
-                            break
+class ParseResult(NamedTuple):
+    accepted: bool
+    # for rejections: index of the offending token (the number of tokens
+    # when input ended too early) and the (top, lookahead) pair there
+    position: int = -1
+    top: Optional[str] = None
+    lookahead: Optional[str] = None
 
-                    # if for never breaks, symbol might be last of production
-                    else:
-                        if symbol != k and k not in visited:
-                            ret |= self.follow(k, visited=visited)
 
-        visited -= {symbol}
-        return ret
+ACCEPTED = ParseResult(accepted=True)
+
 
+class Conflict(NamedTuple):
+    nonterminal: str
+    terminal: str
+    # FIRST/FIRST when every production gets the cell from its first set,
+    # FIRST/FOLLOW when one gets it from the follow set, being nullable
+    kind: str
+    productions: Tuple[str, ...]
+
+
+class LL1Report(NamedTuple):
+    # left-recursive nonterminals, grouped by the cycles they are on, and
+    # every parse table cell claimed by more than one production
+    left_recursion: List[List[str]]
+    conflicts: List[Conflict]
+
+    @property
     def is_ll1(self) -> bool:
-        def has_left_recursion() -> bool:
-            for x in self.nonterminals:
-                if x in self.first_nonterminal(x):
-                    return True
-            return False
-
-        def is_factored() -> bool:
-            for y in self.productions.values():
-                if len(y) != len(set(production[0] for production in y)):
-                    return False
-            return True
-
-        def has_ambiguity():
-            for x in self.nonterminals:
-                first = self.first(x)
-                if '&' not in first:
-                    continue
+        return not self.left_recursion and not self.conflicts
+
+    def __str__(self):
+        lines = [f"left recursion through {', '.join(cycle)}" for cycle in self.left_recursion]
+        lines += [
+            f"{c.kind} conflict at ({c.nonterminal}, {c.terminal}): {' | '.join(c.productions)}"
+            for c in self.conflicts
+        ]
+        return '\n'.join(lines) if lines else 'LL(1)'
+
+
+class Reduction(NamedTuple):
+    # the grammar without useless symbols, and why each removed nonterminal
+    # went: 'infertile' when it derives no sentence, 'unreachable' when no
+    # sentential form from the initial symbol contains it
+    grammar: 'CFG'
+    removed: Dict[str, str]
+
+
+class CompiledTable:
+    # LL(1) table with symbols interned to ints: terminals (and '$') come
+    # first, then nonterminals; cells hold production ids (-1 for errors)
+    # and bodies are stored reversed, ready to be pushed on the stack
+    __slots__ = (
+        'symbols', 'ids', 'tokens', 'n_terminals', 'initial', 'end',
+        'productions', 'bodies', 'cells',
+    )
+
+    def __init__(self, grammar: 'CFG', table: Dict[Tuple[str, str], str]):
+        productions = grammar.interned()
+        names = productions.symbols.names
+
+        s = grammar.initial_symbol
+        terminals = sorted(grammar.terminals - {'$'}) + ['$']
+        nonterminals = [s] + sorted(grammar.nonterminals - {s})
+
+        self.symbols = terminals + nonterminals
+        self.ids = {x: i for i, x in enumerate(self.symbols)}
+        # ids of the symbols an input token may stand for
+        self.tokens = {x: i for i, x in enumerate(terminals[:-1])}
+        self.n_terminals = n = len(terminals)
+        self.initial = self.ids[s]
+        self.end = self.ids['$']
+
+        # interned productions are already ordered like the nonterminals
+        self.productions = productions.sources
+        self.bodies = [
+            tuple(self.ids[names[y]] for y in reversed(body))
+            for body in productions.bodies
+        ]
+
+        index = {(names[x], p): i for i, (x, p) in enumerate(zip(productions.heads, productions.sources))}
+        self.cells = array('i', [-1]) * (len(nonterminals) * n)
+        for (x, t), p in table.items():
+            self.cells[(self.ids[x] - n) * n + self.ids[t]] = index[(x, p)]
+
+    def __getstate__(self):
+        # a table loaded from the grammar cache has its cells in a view of
+        # the mapped file, which cannot be pickled; they go as an array
+        state = {name: getattr(self, name) for name in self.__slots__}
+        if not isinstance(self.cells, array):
+            state['cells'] = array('i', self.cells)
+        return state
+
+    def __setstate__(self, state):
+        for name, value in state.items():
+            setattr(self, name, value)
+
+    def lookup(self, nonterminal: str, terminal: str) -> Optional[str]:
+        row, col = self.ids.get(nonterminal, -1), self.ids.get(terminal, -1)
+        if row < self.n_terminals or not 0 <= col < self.n_terminals:
+            return None
+
+        rule = self.cells[(row - self.n_terminals) * self.n_terminals + col]
+        return self.productions[rule] if rule >= 0 else None
+
+    def check(self, tokens: Iterable[str]) -> 'ParseResult':
+        report = _report()
+        if report is None:
+            return self._check(tokens)
+
+        with report.timing('parse'):
+            tokens = list(tokens)
+            expansions = [0]
+            result = self._check(tokens, expansions)
+            report.parsed(len(tokens) if result.accepted else result.position, expansions[0])
+        return result
+
+    def _check(self, tokens: Iterable[str], expansions: Optional[List[int]] = None) -> 'ParseResult':
+        ids, n, cells, bodies = self.tokens, self.n_terminals, self.cells, self.bodies
+        stack = [self.end, self.initial]
+        pop, extend = stack.pop, stack.extend
+
+        # when instrumented, expansions are counted as production bodies
+        # are pushed, which leaves the loop below as it is otherwise
+        if expansions is not None:
+            def extend(body, push=stack.extend):
+                expansions[0] += 1
+                push(body)
+
+        # None marks the end of the sentence
+        for i, token in enumerate(chain(tokens, (None,))):
+            front = ids.get(token, -1) if token is not None else self.end
+
+            # expand until a terminal is on top, then match it
+            top = pop()
+            while top >= n and front >= 0:
+                rule = cells[(top - n) * n + front]
+                if rule < 0:
+                    break
 
-                if first & self.follow(x):
-                    return True
-            return False
+                extend(bodies[rule])
+                top = pop()
 
-        return not has_left_recursion() and is_factored() and not has_ambiguity()
+            if top != front:
+                return ParseResult(
+                    accepted=False,
+                    position=i,
+                    top=self.symbols[top],
+                    lookahead='$' if token is None else token,
+                )
 
-    def parse_table(self) -> Dict[Tuple[str, str], str]:
-        table = {}
+        return ACCEPTED
+
+    def recognize(self, tokens: Iterable[str]) -> bool:
+        return self.check(tokens).accepted
 
-        for nt, p in ((x, y) for x, v in self.productions.items() for y in v):
-            for symbol in p.split():
-                first = self.first(symbol)
+    def trace(self, tokens: List[str], interval: int = 256) -> 'ParseTrace':
+        report = _report()
+        if report is None:
+            return self._trace(tokens, interval)
 
-                for t in (first - {'&'}):
-                    table[(nt, t)] = p
+        with report.timing('parse'):
+            trace = self._trace(tokens, interval)
+            matches = trace.actions.count(ParseTrace.MATCH)
+            report.parsed(matches, len(trace.actions) - matches)
+        return trace
 
-                if '&' not in first:
+    def _trace(self, tokens: List[str], interval: int) -> 'ParseTrace':
+        ids, n, cells, bodies = self.tokens, self.n_terminals, self.cells, self.bodies
+        trace = ParseTrace(self, tokens, interval)
+        actions, checkpoints = trace.actions, trace.checkpoints
+
+        # tokens unknown to the grammar get -1, which matches nothing
+        sentence = [ids.get(t, -1) for t in tokens] + [self.end]
+        stack = [self.end, self.initial]
+        i = 0
+
+        while True:
+            if len(actions) % interval == 0:
+                checkpoints.append((tuple(stack), i))
+
+            front, top = sentence[i], stack.pop()
+
+            if top < n:
+                if top != front:
+                    trace.error = f'{self.symbols[top]} != {trace.lookahead(i)}'
+                    break
+
+                # sentence is over
+                if top == self.end:
                     break
+
+                i += 1
+                actions.append(ParseTrace.MATCH)
+
             else:
-                for t in self.follow(nt):
-                    table[(nt, t)] = p
+                rule = cells[(top - n) * n + front] if front >= 0 else -1
+                if rule < 0:
+                    trace.error = (f'there is no ({self.symbols[top]}, '
+                                   f'{trace.lookahead(i)}) in parse table')
+                    break
 
-        return table
+                stack.extend(bodies[rule])
+                actions.append(rule)
 
-    def parse(self, sentence: str):
-        table = self.parse_table()
+        return trace
 
-        sentence = sentence.split() + ['$']
-        stack = ['$', self.initial_symbol]
 
-        yield sentence[:-1], stack[1:]
+class ParseTrace:
+    # one action per parse step: MATCH for a matched terminal, otherwise the
+    # id of the expanded production; the stack and input of any step are
+    # rebuilt on demand by replaying actions from the closest checkpoint
+    MATCH = -1
 
-        while True:
-            front, top = sentence[0], stack.pop()
+    __slots__ = ('table', 'tokens', 'interval', 'actions', 'checkpoints', 'error')
 
-            # we stacked empty symbol
-            if top == '&':
-                continue
+    def __init__(self, table: CompiledTable, tokens: List[str], interval: int):
+        self.table = table
+        self.tokens = tokens
+        self.interval = interval
+        self.actions = array('i')
+        self.checkpoints = []
+        self.error = None
 
-            # sentence is over
-            if top == front == '$':
-                break
+    @property
+    def accepted(self) -> bool:
+        return self.error is None
 
-            if top in self.terminals:
-                if top != front:
-                    raise ValueError(f'{top} != {front}')
+    def lookahead(self, i: int) -> str:
+        return self.tokens[i] if i < len(self.tokens) else '$'
+
+    def __len__(self):
+        return len(self.actions) + 1
+
+    def __getitem__(self, step: int) -> Tuple[List[str], List[str]]:
+        if step < 0:
+            step += len(self)
+        if not 0 <= step < len(self):
+            raise IndexError('parse step out of range')
+
+        k = step // self.interval
+        stack, i = self.checkpoints[k]
+        stack = list(stack)
+
+        bodies = self.table.bodies
+        for action in islice(self.actions, k * self.interval, step):
+            stack.pop()
+            if action == self.MATCH:
+                i += 1
+            else:
+                stack.extend(bodies[action])
+
+        return self._snapshot(stack, i)
+
+    def __iter__(self) -> Iterator[Tuple[List[str], List[str]]]:
+        stack, i = self.checkpoints[0]
+        stack = list(stack)
+        yield self._snapshot(stack, i)
+
+        bodies = self.table.bodies
+        for action in self.actions:
+            stack.pop()
+            if action == self.MATCH:
+                i += 1
+            else:
+                stack.extend(bodies[action])
+
+            yield self._snapshot(stack, i)
+
+    def _snapshot(self, stack: List[int], i: int) -> Tuple[List[str], List[str]]:
+        symbols = self.table.symbols
+        return self.tokens[i:], [symbols[s] for s in stack[1:]]
+
+
+class CFG(NamedTuple):
+    initial_symbol: str
+    productions: Dict[str, Set[str]]
+    nonterminals: Set[str]
+    terminals: Set[str]
+    cache: Optional[AnalysisCache] = None
+
+    def _cached(self, key: str, compute: Callable[[], Any]) -> Any:
+        report = _report()
+        if report is not None:
+            def compute(compute=compute):
+                with report.timing(key):
+                    return compute()
+
+        if self.cache is None:
+            return compute()
+        return self.cache.get(key, compute)
+
+    def invalidate(self):
+        # must be called after mutating self.productions in place; the
+        # symbol sets are recomputed in place as well, the tuple being
+        # immutable
+        fresh = self.create(self.initial_symbol, self.productions)
+        for derived, value in ((self.nonterminals, fresh.nonterminals), (self.terminals, fresh.terminals)):
+            derived.clear()
+            derived.update(value)
+
+        if self.cache is not None:
+            self.cache.invalidate()
+
+    def interned(self) -> Productions:
+        return self._cached('productions', lambda: Productions(self))
+
+    def analysis(self) -> Analysis:
+        return self._cached('analysis', self._analyze)
+
+    def _analyze(
+        self,
+        base: Optional[Analysis] = None,
+        changed: Optional[Set[int]] = None,
+        seeds: Optional[Set[int]] = None,
+    ) -> Analysis:
+        # with a base analysis only the sets that may depend on the changed
+        # nonterminals are recomputed, the others are shared with base;
+        # seeds are nonterminals whose follow must be recomputed regardless
+        grammar = self.interned()
+        nonterminals, heads, bodies = grammar.nonterminals, grammar.heads, grammar.bodies
+        rules = grammar.rules
+
+        with _phase('nullable'):
+            # nullable: count, for each rule, the symbols not yet known to be
+            # nullable and queue its head once that count reaches zero
+            if base is None:
+                scope, nullable = nonterminals, set()
+            else:
+                # only rules made of nonterminals alone can be nullable
+                users = {}
+                for x, body in zip(heads, bodies):
+                    if all(y in nonterminals for y in body):
+                        for y in body:
+                            users.setdefault(y, set()).add(x)
+
+                scope = _closure(changed, users) & nonterminals
+                nullable = (base._nullable & nonterminals) - scope
+
+            scoped = [r for x in scope for r in rules[x]]
+            missing = [sum(y not in nullable for y in bodies[r]) for r in scoped]
+            occurrences = {x: [] for x in scope}
+            for i, r in enumerate(scoped):
+                for y in bodies[r]:
+                    if y in occurrences:
+                        occurrences[y].append(i)
+
+            worklist = [heads[r] for r, m in zip(scoped, missing) if m == 0]
+            while worklist:
+                x = worklist.pop()
+                if x in nullable:
+                    continue
+
+                nullable.add(x)
+                for i in occurrences[x]:
+                    missing[i] -= 1
+                    if missing[i] == 0:
+                        worklist.append(heads[scoped[i]])
+
+        with _phase('first'):
+            # first and first-nt: x -> ... y ... with a nullable prefix before y
+            # means first(y) is contained in first(x)
+            starts = {x: set() for x in nonterminals}
+            for x, body in zip(heads, bodies):
+                for y in body:
+                    if y not in nonterminals:
+                        break
+                    starts[y].add(x)
+                    if y not in nullable:
+                        break
+
+            direct = {x: set() for x in nonterminals}
+            for y, xs in starts.items():
+                for x in xs:
+                    direct[x].add(y)
+
+            if base is None:
+                edges = starts
+            else:
+                dirty = changed | (nullable ^ base._nullable)
+                scope = _closure(dirty, starts) & nonterminals
+                edges = {y: starts[y] & scope for y in scope}
+
+            first = {}
+            for x in scope:
+                first_x = 0
+                for r in rules[x]:
+                    for y in bodies[r]:
+                        if y not in nonterminals:
+                            first_x |= 1 << y
+                            break
 
-                _, *sentence = sentence
+                        if y not in scope:
+                            first_x |= base._first[y]
 
+                        if y not in nullable:
+                            break
+                first[x] = first_x
+
+            _propagate(first, edges)
+
+            if base is not None:
+                first = {**{x: base._first[x] for x in nonterminals - scope}, **first}
+
+        with _phase('follow'):
+            # follow: walk each rule backwards keeping first() of the suffix;
+            # a nullable suffix after y means follow(x) is contained in follow(y)
+            inherits = {x: set() for x in nonterminals}
+            for x, body in zip(heads, bodies):
+                for y in reversed(body):
+                    if y not in nonterminals:
+                        break
+                    if y != x:
+                        inherits[x].add(y)
+                    if y not in nullable:
+                        break
+
+            if base is None:
+                seeds = nonterminals
+            else:
+                # also recompute y when first() of what may follow it changed
+                seeds = set(seeds)
+                for body in bodies:
+                    window = False
+                    for y in reversed(body):
+                        if window and y in nonterminals:
+                            seeds.add(y)
+                        touched = y in scope or y in changed
+                        window = (window or touched) if y in nullable else touched
+
+                seeds = _closure(seeds, inherits)
+
+            follow = dict.fromkeys(seeds, 0)
+            if grammar.initial in follow:
+                # '$' is symbol 0
+                follow[grammar.initial] = 1
+
+            for x, body in zip(heads, bodies):
+                if seeds is not nonterminals and seeds.isdisjoint(body):
+                    continue
+
+                trailer = 0
+                for y in reversed(body):
+                    if y not in nonterminals:
+                        trailer = 1 << y
+                        continue
+
+                    if y in follow:
+                        follow[y] |= trailer
+                        if y in inherits[x] and x not in follow:
+                            follow[y] |= base._follow[x]
+
+                    if y in nullable:
+                        trailer |= first[y]
+                    else:
+                        trailer = first[y]
+
+            if base is None:
+                _propagate(follow, inherits)
             else:
-                rule = table.get((top, front))
-                if rule:
-                    if rule != '&':
-                        stack.extend(reversed(rule.split()))
+                _propagate(follow, {x: inherits[x] & seeds for x in seeds})
+                follow = {**{x: base._follow[x] for x in nonterminals - seeds}, **follow}
+
+        return Analysis(
+            symbols=grammar.symbols,
+            nullable=nullable,
+            first=first,
+            follow=follow,
+            direct=direct,
+        )
 
+    def reanalyze(self, previous: 'CFG') -> Analysis:
+        base = previous.cache.peek('analysis') if previous.cache is not None else None
+        if (base is None or previous.initial_symbol != self.initial_symbol
+                or self.cache.peek('productions') is not None):
+            return self.analysis()
+
+        changed = {
+            x for x in self.nonterminals | previous.nonterminals
+            if self.productions.get(x) != previous.productions.get(x)
+        }
+
+        # a removed nonterminal reads as a terminal now, which changes the
+        # meaning of the productions using it
+        removed = previous.nonterminals - self.nonterminals
+        if removed:
+            changed |= {
+                x for x, v in self.productions.items()
+                if any(not removed.isdisjoint(p.split()) for p in v)
+            }
+
+        # nonterminals in added or removed productions may follow something else
+        seeds = changed & self.nonterminals
+        for x in changed:
+            for p in chain(self.productions.get(x, ()), previous.productions.get(x, ())):
+                seeds.update(y for y in p.split() if y in self.nonterminals)
+
+        # keep the previous ids, so the base sets still make sense here
+        grammar = Productions(self, symbols=base.symbols.copy())
+        self.cache.put('productions', grammar)
+        ids = grammar.symbols.ids
+        changed = {ids[x] for x in changed}
+        seeds = {ids[x] for x in seeds}
+
+        analysis = self._analyze(base=base, changed=changed, seeds=seeds)
+        self.cache.put('analysis', analysis)
+
+        table = previous.cache.peek('parse_table')
+        if table is not None:
+            # a row reads its own follow set and the first sets of the
+            # nonterminals in its bodies
+            moved = {
+                x for x in grammar.nonterminals
+                if analysis._first[x] != base._first.get(x)
+                or (x in analysis._nullable) != (x in base._nullable)
+            }
+            rows = changed | {
+                x for x in grammar.nonterminals
+                if analysis._follow[x] != base._follow.get(x)
+            } | {
+                x for x, body in zip(grammar.heads, grammar.bodies)
+                if not moved.isdisjoint(body)
+            }
+            self.cache.put('parse_table', self._parse_table(base=table, rows=rows))
+
+        return analysis
+
+    def first(self, sentence: str) -> Set[str]:
+        return self.analysis().first_of(sentence.split())
+
+    def first_nonterminal(self, symbol: str) -> Set[str]:
+        if symbol == '&':
+            return {symbol}
+
+        analysis = self.analysis()
+        x = analysis.symbols.ids.get(symbol)
+        if x not in analysis._direct:
+            return set()
+
+        names = analysis.symbols.names
+        first_nt = {names[y] for y in analysis._first_nt_of(x)}
+        if x in analysis._nullable:
+            first_nt.add('&')
+        return first_nt
+
+    def follow(self, symbol: str) -> Set[str]:
+        return set(self.analysis().follow.get(symbol, ()))
+
+    def is_ll1(self) -> bool:
+        return self._cached('is_ll1', self._is_ll1)
+
+    def _is_ll1(self) -> bool:
+        # as the report, but done at the first conflicting cell or cycle
+        report = self.cache.peek('ll1_report') if self.cache is not None else None
+        if report is not None:
+            return report.is_ll1
+
+        grammar, analysis = self.interned(), self.analysis()
+        for x, rules in grammar.rules.items():
+            seen, overlap, claimed = 0, 0, 0
+            nullables = 0
+            for r in rules:
+                first, nullable = analysis._first_of(grammar.bodies[r])
+                overlap |= seen & first
+                seen |= first
+                if nullable:
+                    nullables += 1
                 else:
-                    raise ValueError(f'there is no ({top}, {front}) in parse table')
+                    claimed |= first
+
+            # the follow set is claimed by every nullable production; a
+            # single one only conflicts with the others' first sets
+            if nullables > 1:
+                overlap |= analysis._follow[x]
+            elif nullables:
+                overlap |= analysis._follow[x] & claimed
+            if overlap:
+                return False
+
+        return next(analysis._left_recursive(), None) is None
+
+    def ll1_report(self) -> LL1Report:
+        return self._cached('ll1_report', self._ll1_report)
+
+    def _ll1_report(self) -> LL1Report:
+        # overlaps of the first sets of each nonterminal's productions (and
+        # of its follow set, for nullable ones) are found with set
+        # operations; only the cells found there are looked at one by one
+        grammar, analysis = self.interned(), self.analysis()
+        names = grammar.symbols.names
+
+        competing = {}
+        for x, rules in grammar.rules.items():
+            firsts = [(r, *analysis._first_of(grammar.bodies[r])) for r in rules]
+            follow = analysis._follow[x]
+
+            seen, overlap = 0, 0
+            for _, first, nullable in firsts:
+                overlap |= seen & first
+                seen |= first
+            nullables = sum(nullable for _, _, nullable in firsts)
+            if nullables:
+                overlap |= follow if nullables > 1 else follow & seen
+
+            for t in _bits(overlap):
+                # a claim tells whether the production got the cell through
+                # follow; one production claiming it twice is no conflict
+                claims = {
+                    r: not first >> t & 1
+                    for r, first, nullable in firsts
+                    if first >> t & 1 or nullable and follow >> t & 1
+                }
+                if len(claims) > 1:
+                    competing[(x, t)] = claims
+
+        conflicts = sorted(
+            Conflict(
+                nonterminal=names[x],
+                terminal=names[t],
+                kind='FIRST/FOLLOW' if any(claims.values()) else 'FIRST/FIRST',
+                productions=tuple(sorted(grammar.sources[r] for r in claims)),
+            )
+            for (x, t), claims in competing.items()
+        )
 
-            yield sentence[:-1], stack[1:]
+        left_recursion = sorted(
+            sorted(names[x] for x in cycle)
+            for cycle in analysis._left_recursive()
+        )
 
-    def without_infertile(self):
-        def fertile(ni):
-            for symbol in ni:
-                yield symbol
+        return LL1Report(left_recursion=left_recursion, conflicts=conflicts)
 
-            allowed = ni | self.terminals | {'&'}
-            for symbol, productions in self.productions.items():
-                for ys in (set(p.split()) for p in productions):
-                    if ys <= allowed:
-                        yield symbol
+    def parse_table(self) -> Dict[Tuple[str, str], str]:
+        return dict(self._cached('parse_table', self._parse_table))
+
+    def _parse_table(
+        self,
+        base: Optional[Dict[Tuple[str, str], str]] = None,
+        rows: Optional[Set[int]] = None,
+    ) -> Dict[Tuple[str, str], str]:
+        # with a base table only the given rows are rebuilt; rules go in
+        # sorted order, so a cell claimed by several of them ends up the
+        # same however the production sets were built
+        grammar, analysis = self.interned(), self.analysis()
+        names = grammar.symbols.names
+
+        if base is None:
+            table, rows = {}, grammar.nonterminals
+        else:
+            dropped = {names[x] for x in rows}
+            table = {(x, t): p for (x, t), p in base.items() if x not in dropped}
+
+        for x in rows & grammar.nonterminals:
+            nt = names[x]
+            for r in grammar.rules[x]:
+                p = grammar.sources[r]
+                first, nullable = analysis._first_of(grammar.bodies[r])
+
+                for t in _bits(first):
+                    table[(nt, names[t])] = p
+
+                if nullable:
+                    for t in _bits(analysis._follow[x]):
+                        table[(nt, names[t])] = p
+
+        return table
+
+    def compiled_table(self) -> CompiledTable:
+        return self._cached('compiled_table', self._compiled_table)
+
+    def _compiled_table(self) -> CompiledTable:
+        return CompiledTable(self, self._cached('parse_table', self._parse_table))
+
+    def trace(
+        self,
+        sentence: str,
+        table: Optional[CompiledTable] = None,
+        interval: int = 256,
+    ) -> 'ParseTrace':
+        if table is None:
+            table = self.compiled_table()
+        return table.trace(sentence.split(), interval=interval)
+
+    def parse(self, sentence: str, table: Optional[CompiledTable] = None):
+        trace = self.trace(sentence, table=table)
+        yield from trace
+
+        if not trace.accepted:
+            raise ValueError(trace.error)
+
+    def recognize(self, tokens: Union[str, Iterable[str]]) -> bool:
+        if isinstance(tokens, str):
+            tokens = tokens.split()
+        return self.compiled_table().recognize(tokens)
+
+    def parse_many(
+        self,
+        sentences: Iterable[Union[str, Iterable[str]]],
+        processes: Optional[int] = None,
+        chunksize: int = 1024,
+    ) -> Iterator[ParseResult]:
+        table = self.compiled_table()
+
+        if not processes:
+            for sentence in sentences:
+                if isinstance(sentence, str):
+                    sentence = sentence.split()
+                yield table.check(sentence)
+            return
+
+        # shards keep input order; each worker receives the table only once
+        from concurrent.futures import ProcessPoolExecutor
+        with ProcessPoolExecutor(
+            max_workers=processes,
+            initializer=_init_worker,
+            initargs=(table,),
+        ) as executor:
+            shards = (
+                [s if isinstance(s, str) else list(s) for s in shard]
+                for shard in _chunks(sentences, chunksize)
+            )
+            for results in executor.map(_check_shard, shards):
+                yield from results
+
+    def cnf(self) -> 'CFG':
+        from cyk import to_cnf
+        return self._cached('cnf', lambda: to_cnf(self))
+
+    def cyk(self) -> 'CYK':
+        # recognizer for any grammar, LL(1) or not, through its normal form
+        from cyk import CYK
+        return self._cached('cyk', lambda: CYK(self.cnf()))
+
+    def lalr_table(self) -> 'LRTable':
+        from lr import LRTable
+        return self._cached('lalr_table', lambda: LRTable(self))
+
+    def lalr_trace(self, sentence: str, interval: int = 256) -> 'LRTrace':
+        return self.lalr_table().trace(sentence.split(), interval=interval)
+
+    def lalr_parse(self, sentence: str):
+        # steps as given by parse: (input left, stack), for any LALR(1)
+        # grammar, left-recursive ones included
+        trace = self.lalr_trace(sentence)
+        yield from trace
+
+        if not trace.accepted:
+            raise ValueError(trace.error)
+
+    def earley(self) -> 'Earley':
+        from earley import Earley
+        return self._cached('earley', lambda: Earley(self))
+
+    def parse_forest(self, tokens: Union[str, Iterable[str]]) -> 'Forest':
+        # every parse of tokens, for any grammar, as a shared packed forest
+        if isinstance(tokens, str):
+            tokens = tokens.split()
+        return self.earley().parse(tokens)
+
+    def _fertile(self) -> Set[int]:
+        grammar = self.interned()
+        nonterminals, heads, bodies = grammar.nonterminals, grammar.heads, grammar.bodies
+
+        # a rule makes its head fertile once all nonterminals in its body
+        # are: count the ones not known to be yet, as for nullable
+        missing = [sum(y in nonterminals for y in body) for body in bodies]
+        occurrences = {x: [] for x in nonterminals}
+        for r, body in enumerate(bodies):
+            for y in body:
+                if y in occurrences:
+                    occurrences[y].append(r)
+
+        fertile = set()
+        worklist = [heads[r] for r, m in enumerate(missing) if m == 0]
+        while worklist:
+            x = worklist.pop()
+            if x in fertile:
+                continue
+
+            fertile.add(x)
+            for r in occurrences[x]:
+                missing[r] -= 1
+                if missing[r] == 0:
+                    worklist.append(heads[r])
+
+        return fertile
+
+    def _epsilon_only(self) -> Set[int]:
+        # nullable nonterminals deriving no other sentence: a rule gives its
+        # head a nonempty one once its body is fertile and has a terminal,
+        # or a nonterminal known to derive one
+        grammar = self.interned()
+        nonterminals, heads, bodies = grammar.nonterminals, grammar.heads, grammar.bodies
+        fertile = self._fertile()
+
+        occurrences = {x: [] for x in nonterminals}
+        worklist = []
+        for r, body in enumerate(bodies):
+            if all(y in fertile for y in body if y in nonterminals):
+                if any(y not in nonterminals for y in body):
+                    worklist.append(heads[r])
+                for y in body:
+                    if y in occurrences:
+                        occurrences[y].append(r)
+
+        nonempty = set()
+        while worklist:
+            x = worklist.pop()
+            if x in nonempty:
+                continue
+
+            nonempty.add(x)
+            worklist.extend(heads[r] for r in occurrences[x])
+
+        return self.analysis()._nullable - nonempty
+
+    def _useful(self, fertile: Set[int], reachable: Optional[Set[int]] = None) -> Dict[str, Set[str]]:
+        # productions of kept heads whose bodies only use fertile nonterminals
+        grammar = self.interned()
+        nonterminals, names = grammar.nonterminals, grammar.symbols.names
+        kept = fertile if reachable is None else reachable
 
-        ni, next_ni = set(), set(fertile(set()))
-        while ni != next_ni:
-            ni, next_ni = set(next_ni), set(fertile(next_ni))
+        productions = {}
+        for x, body, p in zip(grammar.heads, grammar.bodies, grammar.sources):
+            if x in kept and all(y in fertile or y not in nonterminals for y in body):
+                productions.setdefault(names[x], set()).add(p)
 
-        fertile = ni | self.terminals | {'&'}
+        return productions
+
+    def without_infertile(self):
         return self.create(
             initial_symbol=self.initial_symbol,
-            productions={
-                symbol: {
-                    production
-                    for production in productions
-                    if all(v in fertile for v in production.split())
-                }
-                for symbol, productions in self.productions.items()
-                if symbol in fertile
-            }
+            productions=self._useful(self._fertile()),
+        )
+
+    def reduced(self) -> Reduction:
+        grammar = self.interned()
+        nonterminals, names = grammar.nonterminals, grammar.symbols.names
+        fertile = self._fertile()
+
+        # breadth-first from the initial symbol, only through rules that
+        # survive the removal of infertile symbols
+        reachable = {grammar.initial} if grammar.initial in fertile else set()
+        queue = deque(reachable)
+        while queue:
+            x = queue.popleft()
+            for r in grammar.rules[x]:
+                body = grammar.bodies[r]
+                if all(y in fertile or y not in nonterminals for y in body):
+                    for y in body:
+                        if y in nonterminals and y not in reachable:
+                            reachable.add(y)
+                            queue.append(y)
+
+        removed = {
+            names[x]: 'unreachable' if x in fertile else 'infertile'
+            for x in nonterminals - reachable
+        }
+
+        return Reduction(
+            grammar=self.create(
+                initial_symbol=self.initial_symbol,
+                productions=self._useful(fertile, reachable),
+            ),
+            removed=removed,
         )
 
     def epsilon_free(self):
-        for symbol, productions in self.productions.items():
-            prod_ = list(productions)
-            for destiny in prod_:
-                for i, char in enumerate(destiny):
-                    if char == ' ':
-                        continue
-                    if '&' in self.first(char):
-                        new_prod = (destiny[:i] + destiny[i:].replace(char, '', 1)).replace('  ', ' ').strip()
-                        prod_.append(new_prod)
-                        self.productions[symbol] |= {new_prod}
+        grammar, nullable = self.interned(), self.analysis()._nullable
+        names = grammar.symbols.names
 
-        for symbol, productions in self.productions.items():
-            if symbol != self.initial_symbol:
-                self.productions[symbol] -= {'&'}
-            self.productions[symbol] -= {''}
+        # nonterminals deriving only the empty sentence go away with their
+        # rules, or they would be left in the bodies as terminals; others
+        # left with no rule at all (A -> A) stay as infertile nonterminals
+        empty = self._epsilon_only()
+
+        productions = {}
+        for x, body in zip(grammar.heads, grammar.bodies):
+            if x in empty:
+                continue
+            variants = productions.setdefault(names[x], set())
+            variants.update(
+                ' '.join(names[y] for y in variant)
+                for variant in _variants(tuple(y for y in body if y not in empty), nullable)
+                if variant and variant != (x,)
+            )
 
         initial = self.initial_symbol
-        if '&' in self.first(initial):
-            self.productions[initial] -= {'&'}
-            self.productions[f"{initial}'"] = {initial, '&'}
-            initial = f"{initial}'"
+        if grammar.initial in empty:
+            productions[initial] = {'&'}
+        elif grammar.initial in nullable:
+            # a fresh start symbol keeps the empty sentence out of the
+            # bodies the old one occurs in
+            while initial in self.productions or initial in self.terminals:
+                initial += "'"
+            productions[initial] = {self.initial_symbol, '&'}
 
         return self.create(
-                initial_symbol=initial,
-                productions={symbol: p for symbol, p in self.productions.items() if len(p) != 0}
-                )
+            initial_symbol=initial,
+            productions=productions,
+        )
 
     def __str__(self):
         alphabet = self.initial_symbol + string.ascii_letters + '&'
@@ -267,49 +1666,51 @@ class CFG(NamedTuple):
                 for production in chain.from_iterable(productions.values())
                 for symbol in production.split()
                 if symbol != '&' and symbol not in nonterminals
-            }
+            },
+            cache=AnalysisCache(),
         )
 
     @classmethod
-    def load(cls, fp: TextIO):
-        initial_symbol, productions = None, {}
-
-        for line in fp:
-            line = line.strip()
-            if not line:
-                continue
-
-            if '->' not in line:
-                logger.warning(f'Invalid line, skipping: {line}')
-                continue
-
-            x, y = [s.strip() for s in line.split('->', maxsplit=1)]
-            if not x:
-                logger.warning(f'Invalid symbol, skipping: {x}')
-                continue
+    def load(
+        cls,
+        fp: Union[TextIO, Iterable[str]],
+        diagnostics: Optional[Diagnostics] = None,
+        processes: Optional[int] = None,
+        files: Optional[List[str]] = None,
+        source: Optional[str] = None,
+    ):
+        # source names the file the text comes from, when fp has no name
+        # of its own: includes resolve against its directory
+        if source is None:
+            source = getattr(fp, 'name', None)
+            source = source if isinstance(source, str) else '<grammar>'
+        return cls._load(fp, source, diagnostics, processes, files)
 
-            if '->' in y:
-                logger.warning(f'Invalid productions, skipping')
-                continue
-
-            if not initial_symbol:
-                initial_symbol = x
-
-            def filter_productions(productions):
-                for p in productions.split('|'):
-                    q = p.strip()
-                    if not q:
-                        logger.warning(f'Empty production, skipping...')
-                        continue
+    @classmethod
+    def load_file(
+        cls,
+        path: str,
+        diagnostics: Optional[Diagnostics] = None,
+        processes: Optional[int] = None,
+        files: Optional[List[str]] = None,
+    ):
+        return cls._load(_mapped_lines(path), path, diagnostics, processes, files)
 
-                    yield q
+    @classmethod
+    def _load(cls, lines, source, diagnostics, processes, files):
+        # without a diagnostics list to fill, problems go to the log;
+        # files, when given, receives the paths of the included files
+        report = diagnostics is None
+        if report:
+            diagnostics = Diagnostics()
 
-            y = set(filter_productions(y))
-            if not y:
-                logger.warning(f'Symbol with no productions, skipping...')
-                continue
+        seen = frozenset({os.path.realpath(source)})
+        files = files if files is not None else []
+        with _phase('load'):
+            initial_symbol, productions = _expand(lines, source, seen, diagnostics, files, processes)
 
-            productions[x] = y
+        if report:
+            diagnostics.log()
 
         if not initial_symbol:
             raise ValueError('Grammar with no symbols!')
@@ -318,3 +1719,11 @@ class CFG(NamedTuple):
             raise ValueError('Grammer with no productions!')
 
         return cls.create(initial_symbol, productions)
+
+
+if __name__ == '__main__':
+    # python -m cfg: the command line, run against this very module rather
+    # than a second copy imported as cfg
+    sys.modules.setdefault('cfg', sys.modules[__name__])
+    from cli import main
+    sys.exit(main())
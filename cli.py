@@ -0,0 +1,195 @@
+import argparse
+import json
+import os
+import sys
+from typing import Dict, List, Optional, Set
+
+from cfg import CFG, Diagnostics, render
+
+# the command line, for batch use: it needs nothing but cfg, and the
+# parsers beyond LL(1) are only imported by the commands running them
+
+TRANSFORMS = ('proper', 'epsilon-free', 'reduced')
+METHODS = ('auto', 'll1', 'lalr', 'earley')
+
+
+def _grammar(path: str) -> CFG:
+    # '-' reads the grammar from standard input; problems found while
+    # loading are reported on standard error
+    diagnostics = Diagnostics()
+    if path == '-':
+        grammar = CFG.load(sys.stdin, diagnostics)
+    else:
+        grammar = CFG.load_file(path, diagnostics)
+
+    for entry in diagnostics:
+        print(entry, file=sys.stderr)
+    if diagnostics.dropped:
+        print(f'{diagnostics.dropped} more problems not shown', file=sys.stderr)
+    return grammar
+
+
+def _sorted(sets: Dict[str, Set[str]]) -> Dict[str, List[str]]:
+    return {x: sorted(s) for x, s in sorted(sets.items())}
+
+
+def _dump(value, args):
+    json.dump(value, sys.stdout, indent=args.indent, sort_keys=args.indent is not None)
+    sys.stdout.write('\n')
+
+
+def analyze(args) -> int:
+    grammar = _grammar(args.grammar)
+    analysis = grammar.analysis()
+    _dump({
+        'initial': grammar.initial_symbol,
+        'nonterminals': sorted(grammar.nonterminals),
+        'terminals': sorted(grammar.terminals),
+        'nullable': sorted(analysis.nullable),
+        'first': _sorted(analysis.first),
+        'follow': _sorted(analysis.follow),
+        'first_nt': _sorted(analysis.first_nt),
+    }, args)
+    return 0
+
+
+def ll1(args) -> int:
+    # exits with 1 when the grammar is not LL(1)
+    report = _grammar(args.grammar).ll1_report()
+    print(report)
+    return 0 if report.is_ll1 else 1
+
+
+def table(args) -> int:
+    # the LL(1) table as {nonterminal: {terminal: production}}
+    grammar = _grammar(args.grammar)
+    report = grammar.ll1_report()
+    if not report.is_ll1:
+        print(f'grammar is not LL(1):\n{report}', file=sys.stderr)
+        return 1
+
+    rows: Dict[str, Dict[str, str]] = {}
+    for (x, t), p in grammar.parse_table().items():
+        rows.setdefault(x, {})[t] = p
+    _dump({x: dict(sorted(row.items())) for x, row in sorted(rows.items())}, args)
+    return 0
+
+
+def transform(args) -> int:
+    grammar = _grammar(args.grammar)
+    if args.transform == 'proper':
+        grammar = grammar.epsilon_free().reduced().grammar
+    elif args.transform == 'epsilon-free':
+        grammar = grammar.epsilon_free()
+        # a nonterminal left with no rule (A -> A) cannot be written out,
+        # so it goes, infertile, with the rules using it
+        if not all(grammar.productions.values()):
+            fertile = grammar.without_infertile()
+            for x in sorted(grammar.nonterminals - fertile.nonterminals):
+                print(f'removed {x}: infertile', file=sys.stderr)
+            grammar = fertile
+    else:
+        reduction = grammar.reduced()
+        for x, reason in sorted(reduction.removed.items()):
+            print(f'removed {x}: {reason}', file=sys.stderr)
+        grammar = reduction.grammar
+
+    if grammar.initial_symbol not in grammar.productions:
+        print('the grammar derives no sentence', file=sys.stderr)
+        return 1
+
+    for line in render(grammar.initial_symbol, grammar.productions):
+        print(line)
+    return 0
+
+
+def _checker(grammar: CFG, method: str):
+    # check(tokens) giving a ParseResult, or a Forest for Earley, both with
+    # accepted and position; the automatic choice is that of the editor
+    if method == 'auto':
+        if grammar.is_ll1():
+            method = 'll1'
+        elif not grammar.lalr_table().conflicts:
+            method = 'lalr'
+        else:
+            method = 'earley'
+
+    if method == 'll1':
+        report = grammar.ll1_report()
+        if not report.is_ll1:
+            raise ValueError(f'grammar is not LL(1):\n{report}')
+        return grammar.compiled_table().check
+    if method == 'lalr':
+        lalr = grammar.lalr_table()
+        for conflict in lalr.conflicts:
+            print(f'warning: {conflict.kind} conflict in state {conflict.state} on {conflict.terminal}: '
+                  f"{' | '.join(conflict.productions)}", file=sys.stderr)
+        return lalr.check
+    return grammar.earley().parse
+
+
+def parse(args) -> int:
+    # one sentence per line of standard input, one verdict per line of
+    # output; exits with 1 when any sentence is rejected
+    check = _checker(_grammar(args.grammar), args.method)
+
+    status = 0
+    for line in sys.stdin:
+        tokens = line.split()
+        result = check(tokens)
+        if result.accepted:
+            print('accepted')
+            continue
+
+        status = 1
+        i = result.position
+        print(f'rejected at {i}: ' + (repr(tokens[i]) if i < len(tokens) else 'end of input'))
+    return status
+
+
+def main(argv: Optional[List[str]] = None) -> int:
+    parser = argparse.ArgumentParser(
+        prog='python -m cfg',
+        description='Analyzes, transforms and runs context-free grammars.',
+    )
+    commands = parser.add_subparsers(dest='command', required=True)
+
+    def command(name, run, help):
+        sub = commands.add_parser(name, help=help)
+        sub.add_argument('grammar', help="grammar file, as read by CFG.load_file ('-' for standard input)")
+        sub.set_defaults(run=run)
+        return sub
+
+    for sub in (
+        command('analyze', analyze, 'nullable, FIRST, FOLLOW and FIRST-NT sets as JSON'),
+        command('table', table, 'LL(1) parse table as JSON'),
+    ):
+        sub.add_argument('-i', '--indent', type=int, help='indent the JSON output by this many spaces')
+
+    command('ll1', ll1, 'tell whether the grammar is LL(1), and why not')
+
+    sub = command('transform', transform, 'print a transformed grammar')
+    sub.add_argument('transform', choices=TRANSFORMS)
+
+    sub = command('parse', parse, 'check the sentences of standard input, one per line')
+    sub.add_argument('-m', '--method', choices=METHODS, default='auto',
+                     help='parser to use; auto takes LL(1), conflict-free LALR(1) or Earley, '
+                          'the first that fits (default: auto)')
+
+    args = parser.parse_args(argv)
+    if args.command == 'parse' and args.grammar == '-':
+        parser.error('parse reads sentences from standard input, so the grammar must be a file')
+
+    try:
+        return args.run(args)
+    except BrokenPipeError:
+        # the reader went away, as head does: the rest is dropped quietly
+        os.dup2(os.open(os.devnull, os.O_WRONLY), sys.stdout.fileno())
+        return 1
+    except (OSError, ValueError) as e:
+        print(e, file=sys.stderr)
+        return 1
+
+
+if __name__ == '__main__':
+    sys.exit(main())
@@ -0,0 +1,319 @@
+import argparse
+import random
+import sys
+import types
+from typing import Dict, Iterator, List, Optional, Tuple
+
+from cfg import CFG
+
+STYLES = ('descent', 'table')
+
+_HEADER = '''\
+# Generated by codegen.py from a grammar with initial symbol {initial}.
+# Do not edit: regenerate it from the grammar instead.
+#
+# check(tokens) gives -1 when the grammar derives tokens, otherwise the
+# position of the first token in error (len(tokens) when input ended too
+# early), as the position of ParseResult.
+
+TOKENS = {tokens!r}
+END = {end}
+'''
+
+_FOOTER = '''
+
+def recognize(tokens):
+    return check(tokens) < 0
+'''
+
+
+def _tables(grammar: CFG):
+    # terminal codes (tokens first, then '$'), the nonterminals in table
+    # order and the LL(1) table as (nonterminal, code) -> production index
+    report = grammar.ll1_report()
+    if not report.is_ll1:
+        raise ValueError(f'grammar is not LL(1):\n{report}')
+
+    productions = grammar.interned()
+    names = productions.symbols.names
+    terminals = sorted(grammar.terminals - {'$'})
+    codes = {x: i for i, x in enumerate(terminals)}
+    codes['$'] = len(terminals)
+
+    index = {
+        (names[x], p): r
+        for r, (x, p) in enumerate(zip(productions.heads, productions.sources))
+    }
+    table = {(x, codes[t]): index[(x, p)] for (x, t), p in grammar.parse_table().items()}
+    s = grammar.initial_symbol
+    return codes, [s] + sorted(grammar.nonterminals - {s}), table
+
+
+def _dispatch(variable: str, codes: List[int]) -> str:
+    if len(codes) == 1:
+        return f'{variable} == {codes[0]}'
+    return f"{variable} in {{{', '.join(map(str, sorted(codes)))}}}"
+
+
+def _descent(grammar: CFG) -> str:
+    # one function per nonterminal, taking the token codes and a position
+    # and returning the position after what it read; a production ending
+    # in its own nonterminal loops instead of recursing, so right-recursive
+    # lists read any length
+    codes, nonterminals, table = _tables(grammar)
+    productions = grammar.interned()
+    names = productions.symbols.names
+    functions = {x: f'_n{i}' for i, x in enumerate(nonterminals)}
+    lines = [
+        '',
+        '',
+        'class _Reject(Exception):',
+        '    pass',
+    ]
+
+    for x in nonterminals:
+        rules: Dict[int, List[int]] = {}
+        for (y, code), r in table.items():
+            if y == x:
+                rules.setdefault(r, []).append(code)
+
+        bodies = {r: [names[y] for y in productions.bodies[r]] for r in rules}
+        loops = any(body and body[-1] == x for body in bodies.values())
+        indent = ' ' * (8 if loops else 4)
+
+        lines += ['', '', f'def {functions[x]}(s, i):', f'    # {x}']
+        if loops:
+            lines.append('    while True:')
+        lines.append(f'{indent}t = s[i]')
+
+        for r, lookaheads in sorted(rules.items(), key=lambda item: min(item[1])):
+            body = bodies[r]
+            lines.append(f'{indent}if {_dispatch("t", lookaheads)}:')
+            lines.append(f"{indent}    # {x} -> {' '.join(body) or '&'}")
+
+            tail = bool(body) and body[-1] == x
+            steps = []
+            for k, y in enumerate(body[:-1] if tail else body):
+                if y in functions:
+                    steps.append(f'i = {functions[y]}(s, i)')
+                elif k == 0:
+                    # read by the dispatch already
+                    steps.append('i += 1')
+                else:
+                    steps += [f'if s[i] != {codes[y]}:', '    raise _Reject(i)', 'i += 1']
+
+            if tail:
+                steps.append('continue')
+            elif steps and steps[-1].startswith('i = _n'):
+                steps[-1] = 'return ' + steps[-1][4:]
+            else:
+                steps.append('return i')
+            lines += [f'{indent}    {step}' for step in steps]
+        lines.append(f'{indent}raise _Reject(i)')
+
+    lines += [
+        '',
+        '',
+        'def check(tokens):',
+        '    s = [TOKENS.get(t, -1) for t in tokens]',
+        '    s.append(END)',
+        '    try:',
+        f'        i = {functions[grammar.initial_symbol]}(s, 0)',
+        '    except _Reject as e:',
+        '        return e.args[0]',
+        '    except RecursionError:',
+        "        raise ValueError('input nested too deeply for recursive descent')",
+        '    return -1 if s[i] == END else i',
+    ]
+
+    return _HEADER.format(
+        initial=grammar.initial_symbol,
+        tokens={t: c for t, c in codes.items() if t != '$'},
+        end=codes['$'],
+    ) + '\n'.join(lines) + '\n' + _FOOTER
+
+
+def _table(grammar: CFG) -> str:
+    # the loop of CompiledTable._check over literal tuples: cells hold
+    # production indexes (-1 for errors), bodies are reversed and
+    # nonterminals are numbered after the terminals
+    codes, nonterminals, table = _tables(grammar)
+    productions = grammar.interned()
+    names = productions.symbols.names
+    n = len(codes)
+    ids = dict(codes)
+    ids.update((x, n + i) for i, x in enumerate(nonterminals))
+
+    cells = [-1] * (len(nonterminals) * n)
+    for (x, code), r in table.items():
+        cells[(ids[x] - n) * n + code] = r
+    bodies = tuple(tuple(ids[names[y]] for y in reversed(body)) for body in productions.bodies)
+
+    return _HEADER.format(
+        initial=grammar.initial_symbol,
+        tokens={t: c for t, c in codes.items() if t != '$'},
+        end=codes['$'],
+    ) + f'''
+# nonterminals, numbered from {n}: {', '.join(nonterminals)}
+_CELLS = {tuple(cells)!r}
+_BODIES = {bodies!r}
+
+
+def check(tokens):
+    stack = [END, {ids[grammar.initial_symbol]}]
+    pop, extend = stack.pop, stack.extend
+    codes = [TOKENS.get(t, -1) for t in tokens]
+    codes.append(END)
+    for i, front in enumerate(codes):
+        top = pop()
+        while top >= {n} and front >= 0:
+            rule = _CELLS[(top - {n}) * {n} + front]
+            if rule < 0:
+                break
+            extend(_BODIES[rule])
+            top = pop()
+        if top != front:
+            return i
+    return -1
+''' + _FOOTER
+
+
+def generate(grammar: CFG, style: str = 'descent') -> str:
+    # source of a module depending on nothing but the standard library
+    if style == 'descent':
+        return _descent(grammar)
+    if style == 'table':
+        return _table(grammar)
+    raise ValueError(f'unknown style {style!r}, expected one of {STYLES}')
+
+
+def load(source: str, name: str = 'generated_parser') -> types.ModuleType:
+    module = types.ModuleType(name)
+    exec(compile(source, f'<{name}>', 'exec'), module.__dict__)
+    return module
+
+
+def sentences(
+    grammar: CFG,
+    count: int = 1000,
+    length: int = 50,
+    seed: int = 0,
+) -> Iterator[List[str]]:
+    # random sentences of about length tokens or less, derived from the
+    # grammar, half of them then broken by dropping, doubling or replacing
+    # a token, so both verdicts are exercised
+    rng = random.Random(seed)
+    reduced = grammar.reduced().grammar
+    if reduced.initial_symbol not in reduced.nonterminals:
+        return
+
+    productions = {x: sorted(p) for x, p in reduced.productions.items()}
+    terminals = sorted(reduced.terminals)
+
+    # shortest sentence length of each nonterminal, to wind derivations down
+    shortest = {x: None for x in productions}
+    changed = True
+    while changed:
+        changed = False
+        for x, bodies in productions.items():
+            for p in bodies:
+                size = 0
+                for y in p.split():
+                    if y in shortest:
+                        if shortest[y] is None:
+                            break
+                        size += shortest[y]
+                    elif y != '&':
+                        size += 1
+                else:
+                    if shortest[x] is None or size < shortest[x]:
+                        shortest[x] = size
+                        changed = True
+
+    def size(p: str) -> int:
+        return sum(shortest[y] if y in shortest else y != '&' for y in p.split())
+
+    for _ in range(count):
+        tokens, stack = [], [reduced.initial_symbol]
+        while stack:
+            y = stack.pop()
+            if y not in productions:
+                if y != '&':
+                    tokens.append(y)
+                continue
+
+            pending = len(tokens) + sum(shortest[z] if z in shortest else 1 for z in stack)
+            if pending < length:
+                p = rng.choice(productions[y])
+            else:
+                p = min(productions[y], key=size)
+            stack.extend(reversed(p.split()))
+
+        if terminals and rng.random() < 0.5:
+            i = rng.randrange(len(tokens) + 1)
+            edit = rng.randrange(3)
+            if edit == 0 and tokens:
+                del tokens[min(i, len(tokens) - 1)]
+            elif edit == 1 and tokens:
+                tokens.insert(i, tokens[min(i, len(tokens) - 1)])
+            else:
+                tokens.insert(i, rng.choice(terminals))
+        yield tokens
+
+
+def verify(
+    grammar: CFG,
+    module: types.ModuleType,
+    samples: Optional[List[List[str]]] = None,
+) -> List[Tuple[List[str], int, int]]:
+    # (tokens, expected, got) for each sentence where the generated module
+    # decides otherwise than the compiled table CFG.parse runs on, given as
+    # rejection positions (-1 for acceptance)
+    table = grammar.compiled_table()
+    if samples is None:
+        samples = sentences(grammar)
+
+    mismatches = []
+    for tokens in samples:
+        expected = table.check(tokens).position
+        got = module.check(tokens)
+        if expected != got:
+            mismatches.append((tokens, expected, got))
+    return mismatches
+
+
+def main(argv: Optional[List[str]] = None) -> int:
+    parser = argparse.ArgumentParser(description='Generates a standalone parser module for an LL(1) grammar.')
+    parser.add_argument('grammar', help='grammar file, as read by CFG.load_file')
+    parser.add_argument('-o', '--output', help='write the module here instead of standard output')
+    parser.add_argument('-s', '--style', choices=STYLES, default='descent',
+                        help='recursive descent or a table-driven loop (default: descent)')
+    parser.add_argument('-v', '--verify', type=int, default=1000, metavar='N',
+                        help='check the module against CFG.parse on N random sentences first (default: 1000)')
+    args = parser.parse_args(argv)
+
+    grammar = CFG.load_file(args.grammar)
+    try:
+        source = generate(grammar, args.style)
+    except ValueError as e:
+        print(e, file=sys.stderr)
+        return 1
+
+    if args.verify:
+        mismatches = verify(grammar, load(source), list(sentences(grammar, args.verify)))
+        for tokens, expected, got in mismatches[:10]:
+            print(f"MISMATCH {' '.join(tokens)!r}: expected {expected}, got {got}", file=sys.stderr)
+        if mismatches:
+            return 1
+
+    if args.output:
+        with open(args.output, 'w') as f:
+            f.write(source)
+    else:
+        sys.stdout.write(source)
+
+    return 0
+
+
+if __name__ == '__main__':
+    sys.exit(main())
@@ -0,0 +1,358 @@
+import gc
+import hashlib
+import io
+import mmap
+import os
+import struct
+import sys
+import tempfile
+from array import array
+from itertools import accumulate, chain
+from typing import Iterable, Iterator, List, NamedTuple, Optional, Sequence, Tuple
+
+from cfg import (
+    CFG, Analysis, AnalysisCache, CompiledTable, Diagnostics, Productions,
+    Symbols,
+)
+
+# file layout: a header, then length-prefixed blocks padded to 8 bytes, in
+# the order written by dump; integer blocks are native ints, read back as
+# memoryviews over the mapped file
+MAGIC = b'LFCG'
+VERSION = 3
+
+_header = struct.Struct('<4sHBB')
+_length = struct.Struct('<Q')
+_byteorder = 0 if sys.byteorder == 'little' else 1
+_itemsize = array('i').itemsize
+
+
+class Compiled(NamedTuple):
+    grammar: CFG
+    # (path, sha256) of each file included by the grammar source
+    dependencies: List[Tuple[str, str]]
+    diagnostics: Diagnostics
+
+
+def _ints(values: Iterable[int]) -> bytes:
+    return array('i', values).tobytes()
+
+
+def _text(values: Iterable[str]) -> bytes:
+    return '\0'.join(values).encode()
+
+
+def _rows(rows: Iterable[Iterable[int]]) -> Tuple[bytes, bytes]:
+    offsets, flat = [0], []
+    for row in rows:
+        flat.extend(row)
+        offsets.append(len(flat))
+    return _ints(offsets), _ints(flat)
+
+
+def _masks(masks: Iterable[int]) -> Tuple[bytes, bytes]:
+    # bitsets as little-endian byte strings, one after the other
+    offsets, flat = [0], bytearray()
+    for mask in masks:
+        flat += mask.to_bytes((mask.bit_length() + 7) // 8, 'little')
+        offsets.append(len(flat))
+    return _ints(offsets), bytes(flat)
+
+
+def _blocks(view: memoryview) -> Iterator[memoryview]:
+    position = _header.size
+    while position < len(view):
+        size, = _length.unpack_from(view, position)
+        position += _length.size
+        if position + size > len(view):
+            raise ValueError('truncated compiled grammar')
+        yield view[position:position + size]
+        position += size + -size % 8
+
+
+def dump(
+    path: str,
+    grammar: CFG,
+    dependencies: Sequence[Tuple[str, str]] = (),
+    diagnostics: Optional[Diagnostics] = None,
+):
+    productions = grammar.interned()
+    analysis = grammar.analysis()
+    table = grammar.compiled_table()
+    ids = productions.symbols.ids
+    order = list(productions.rules)
+    diagnostics = diagnostics if diagnostics is not None else Diagnostics()
+
+    blocks = [
+        _text(productions.symbols.names),
+        _text(productions.sources),
+        _ints([productions.initial, grammar.is_ll1(), table.n_terminals]),
+        _ints(ids[x] for x in sorted(grammar.terminals)),
+        _ints(order),
+        _ints(chain([0], accumulate(len(productions.rules[x]) for x in order))),
+        _ints(productions.heads),
+        *_rows(productions.bodies),
+        _ints(sorted(analysis._nullable)),
+        *_masks(analysis._first[x] for x in order),
+        *_masks(analysis._follow[x] for x in order),
+        *_rows(analysis._direct[x] for x in order),
+        _ints(ids[x] for x in table.symbols),
+        *_rows(table.bodies),
+        table.cells.tobytes(),
+        _text(chain.from_iterable(dependencies)),
+        _ints([diagnostics.limit, diagnostics.count]),
+        _text(f'{source}\0{line}\0{message}' for source, line, message in diagnostics),
+    ]
+
+    # written aside and moved in place, so readers never see half a file
+    directory = os.path.dirname(os.path.abspath(path))
+    with tempfile.NamedTemporaryFile('wb', dir=directory, delete=False) as f:
+        try:
+            f.write(_header.pack(MAGIC, VERSION, _byteorder, _itemsize))
+            for block in blocks:
+                f.write(_length.pack(len(block)))
+                f.write(block)
+                f.write(bytes(-len(block) % 8))
+        except BaseException:
+            os.unlink(f.name)
+            raise
+    os.replace(f.name, path)
+
+
+def load(path: str) -> Compiled:
+    # everything built here is acyclic, so collections triggered by the
+    # millions of new containers of a big grammar would find nothing
+    enabled = gc.isenabled()
+    gc.disable()
+    try:
+        return _load(path)
+    finally:
+        if enabled:
+            gc.enable()
+
+
+def _load(path: str) -> Compiled:
+    with open(path, 'rb') as f:
+        size = os.fstat(f.fileno()).st_size
+        if size < _header.size:
+            raise ValueError('not a compiled grammar')
+        buf = mmap.mmap(f.fileno(), 0, access=mmap.ACCESS_READ)
+
+    view = memoryview(buf)
+    magic, version, byteorder, itemsize = _header.unpack_from(view)
+    if magic != MAGIC:
+        raise ValueError('not a compiled grammar')
+    if (version, byteorder, itemsize) != (VERSION, _byteorder, _itemsize):
+        raise ValueError(f'unsupported compiled grammar (version {version})')
+
+    blocks = _blocks(view)
+    try:
+        def ints():
+            return next(blocks).cast('i')
+
+        def text():
+            block = next(blocks)
+            return str(block, 'utf-8').split('\0') if block else []
+
+        def rows():
+            # slices of a tuple are tuples already
+            offsets, flat = ints().tolist(), tuple(ints())
+            return [flat[a:b] for a, b in zip(offsets, offsets[1:])]
+
+        def masks():
+            offsets, flat = ints().tolist(), next(blocks)
+            return [int.from_bytes(flat[a:b], 'little') for a, b in zip(offsets, offsets[1:])]
+
+        names, sources = text(), text()
+        initial, is_ll1, n_terminals = ints()
+        terminals, order, rules, heads, bodies = ints(), ints(), ints().tolist(), ints(), rows()
+        nullable, first, follow, direct = ints(), masks(), masks(), rows()
+        table_symbols, table_bodies, cells = ints(), rows(), ints()
+        dependencies = text()
+        limit, count = ints()
+        entries = text()
+    except (StopIteration, TypeError):
+        raise ValueError('truncated compiled grammar') from None
+
+    symbols = Symbols(names)
+
+    # the interned tables are filled in directly, without going through
+    # the strings again
+    productions = Productions.__new__(Productions)
+    productions.symbols = symbols
+    productions.initial = initial
+    productions.nonterminals = set(order)
+    productions.heads = heads
+    productions.bodies = bodies
+    productions.sources = sources
+    # productions are grouped by head, in the order of the nonterminals
+    spans = list(zip(order, rules, rules[1:]))
+    productions.rules = {x: list(range(a, b)) for x, a, b in spans}
+
+    analysis = Analysis(
+        symbols=symbols,
+        nullable=set(nullable),
+        first=dict(zip(order, first)),
+        follow=dict(zip(order, follow)),
+        direct={x: set(s) for x, s in zip(order, direct)},
+    )
+
+    grammar = CFG(
+        initial_symbol=names[initial],
+        productions={names[x]: set(sources[a:b]) for x, a, b in spans},
+        nonterminals={names[x] for x in order},
+        terminals={names[x] for x in terminals},
+        cache=AnalysisCache(),
+    )
+
+    table = CompiledTable.__new__(CompiledTable)
+    table.symbols = [names[x] for x in table_symbols]
+    table.ids = {x: i for i, x in enumerate(table.symbols)}
+    table.tokens = {x: i for i, x in enumerate(table.symbols[:n_terminals - 1])}
+    table.n_terminals = n_terminals
+    table.initial = table.ids[grammar.initial_symbol]
+    table.end = table.ids['$']
+    table.productions = sources
+    table.bodies = table_bodies
+    table.cells = cells
+
+    grammar.cache.put('productions', productions)
+    grammar.cache.put('analysis', analysis)
+    grammar.cache.put('is_ll1', bool(is_ll1))
+    grammar.cache.put('compiled_table', table)
+
+    diagnostics = Diagnostics(limit)
+    for i in range(0, len(entries), 3):
+        source, line, message = entries[i:i + 3]
+        diagnostics.add(source, int(line), message)
+    diagnostics.count = count
+
+    return Compiled(
+        grammar=grammar,
+        dependencies=list(zip(dependencies[::2], dependencies[1::2])),
+        diagnostics=diagnostics,
+    )
+
+
+def _digest(data, directory: Optional[str] = None) -> str:
+    # includes are resolved against the source's directory, so a source
+    # that may have some is only the same grammar in the same directory
+    # (data may be an mmap, which has find but no substring test)
+    digest = hashlib.sha256(data)
+    if directory is not None and data.find(b'include') != -1:
+        digest.update(b'\0' + os.path.realpath(directory).encode())
+    return digest.hexdigest()
+
+
+def _file_digest(path: str, source: bool = False) -> str:
+    directory = os.path.dirname(path) if source else None
+    with open(path, 'rb') as f:
+        if os.fstat(f.fileno()).st_size == 0:
+            return _digest(b'')
+        with mmap.mmap(f.fileno(), 0, access=mmap.ACCESS_READ) as buf:
+            return _digest(buf, directory)
+
+
+class GrammarCache:
+    # compiled grammars stored under the sha256 of their source; an entry
+    # is only used while the files that source includes are unchanged,
+    # and the least recently used entries go beyond max_entries or, taken
+    # together, max_bytes (an entry holds the dense LL(1) table)
+    def __init__(
+        self,
+        directory: Optional[str] = None,
+        max_entries: int = 64,
+        max_bytes: int = 256 << 20,
+    ):
+        if directory is None:
+            base = os.environ.get('XDG_CACHE_HOME') or os.path.join(os.path.expanduser('~'), '.cache')
+            directory = os.path.join(base, 'lfc-t2')
+
+        self.directory = directory
+        self.max_entries = max_entries
+        self.max_bytes = max_bytes
+        self.hits = 0
+        self.misses = 0
+
+    def load_file(self, path: str, diagnostics: Optional[Diagnostics] = None) -> CFG:
+        def build(found, files):
+            return CFG.load_file(path, found, files=files)
+
+        return self._load(_file_digest(path, source=True), build, diagnostics)
+
+    def load_text(
+        self,
+        text: str,
+        diagnostics: Optional[Diagnostics] = None,
+        previous: Optional[CFG] = None,
+        source: Optional[str] = None,
+    ) -> CFG:
+        # text being edited is seldom seen twice, so it is never stored:
+        # it is built, from what is still valid in previous if given, with
+        # includes resolved next to source, the file it is an edit of
+        found = Diagnostics()
+        grammar = CFG.load(io.StringIO(text), found, source=source)
+        if previous is not None:
+            grammar.reanalyze(previous)
+
+        if diagnostics is None:
+            found.log()
+        else:
+            diagnostics.extend(found)
+
+        return grammar
+
+    def _load(self, key, build, diagnostics):
+        path = os.path.join(self.directory, f'{key}.lfcg')
+
+        entry = self._get(path)
+        if entry is not None:
+            self.hits += 1
+            grammar, found = entry.grammar, entry.diagnostics
+        else:
+            self.misses += 1
+            found, files = Diagnostics(), []
+            grammar = build(found, files)
+            try:
+                self._put(path, grammar, files, found)
+            except OSError:
+                # the cache is only an aid: the grammar stands without it
+                pass
+
+        if diagnostics is None:
+            found.log()
+        else:
+            diagnostics.extend(found)
+
+        return grammar
+
+    def _get(self, path: str) -> Optional[Compiled]:
+        try:
+            entry = load(path)
+            for dependency, digest in entry.dependencies:
+                if _file_digest(dependency) != digest:
+                    return None
+            os.utime(path)
+        except (OSError, ValueError):
+            return None
+
+        return entry
+
+    def _put(self, path: str, grammar: CFG, files: List[str], diagnostics: Diagnostics):
+        os.makedirs(self.directory, exist_ok=True)
+        dump(path, grammar, [(f, _file_digest(f)) for f in files], diagnostics)
+
+        entries = sorted(
+            (e for e in os.scandir(self.directory) if e.name.endswith('.lfcg')),
+            key=lambda e: e.stat().st_mtime,
+            reverse=True,
+        )
+        kept = 0
+        for i, e in enumerate(entries):
+            kept += e.stat().st_size
+            if i < self.max_entries and kept <= self.max_bytes:
+                continue
+            try:
+                os.unlink(e.path)
+            except OSError:
+                pass
@@ -0,0 +1,199 @@
+from typing import Dict, Iterable, List, Optional, Set, Tuple
+
+from cfg import CFG, _closure
+
+try:
+    import numpy
+except ImportError:  # the bitmask chart is used instead
+    numpy = None
+
+
+def _fresh(name: str, taken: Set[str]) -> str:
+    while name in taken:
+        name += "'"
+    taken.add(name)
+    return name
+
+
+def _without_units(grammar: CFG) -> CFG:
+    # each nonterminal takes the other productions of every nonterminal it
+    # reaches through unit productions (A -> B)
+    interned = grammar.interned()
+    nonterminals, names = interned.nonterminals, interned.symbols.names
+
+    units = {x: set() for x in nonterminals}
+    for x, body in zip(interned.heads, interned.bodies):
+        if len(body) == 1 and body[0] in nonterminals:
+            units[x].add(body[0])
+
+    productions = {}
+    for x in nonterminals:
+        productions[names[x]] = {
+            interned.sources[r]
+            for y in _closure({x}, units)
+            for r in interned.rules[y]
+            if not (len(interned.bodies[r]) == 1 and interned.bodies[r][0] in nonterminals)
+        }
+
+    return CFG.create(grammar.initial_symbol, productions)
+
+
+def to_cnf(grammar: CFG) -> CFG:
+    # Chomsky normal form: every production is A -> B C or A -> a, and only
+    # the initial symbol may derive '&' (never occurring in a body then)
+    grammar = grammar.epsilon_free()
+    grammar = _without_units(grammar)
+    grammar = grammar.reduced().grammar
+
+    interned = grammar.interned()
+    nonterminals, names = interned.nonterminals, interned.symbols.names
+    taken = set(names)
+
+    # terminals in long bodies go through a nonterminal of their own, and
+    # long bodies are split into pairs, sharing the nonterminals of equal
+    # suffixes
+    wrappers: Dict[int, str] = {}
+    suffixes: Dict[Tuple[str, ...], str] = {}
+    productions: Dict[str, Set[str]] = {}
+
+    def wrap(y: int) -> str:
+        if y in nonterminals:
+            return names[y]
+        if y not in wrappers:
+            wrappers[y] = _fresh(f'<{names[y]}>', taken)
+            productions[wrappers[y]] = {names[y]}
+        return wrappers[y]
+
+    def pair(head: str, body: Tuple[str, ...]) -> str:
+        if len(body) == 2:
+            return ' '.join(body)
+        rest = body[1:]
+        if rest not in suffixes:
+            suffixes[rest] = name = _fresh(f"{head}'", taken)
+            productions[name] = {pair(name, rest)}
+        return f'{body[0]} {suffixes[rest]}'
+
+    for x, body, p in zip(interned.heads, interned.bodies, interned.sources):
+        head = names[x]
+        rules = productions.setdefault(head, set())
+        if len(body) < 2:
+            rules.add(p)
+        else:
+            rules.add(pair(head, tuple(map(wrap, body))))
+
+    return CFG.create(grammar.initial_symbol, productions)
+
+
+class CYK:
+    # membership test for a grammar in Chomsky normal form: chart cells
+    # hold the nonterminals deriving each span, as bitmasks over bit
+    # numbers given to the nonterminals, or as boolean rows under NumPy
+    __slots__ = ('names', 'empty', 'accept', 'terminals', 'pairs', 'rules')
+
+    def __init__(self, grammar: CFG):
+        interned = grammar.interned()
+        nonterminals, names = interned.nonterminals, interned.symbols.names
+        bits = {x: i for i, x in enumerate(sorted(nonterminals))}
+
+        self.names = [names[x] for x in sorted(nonterminals)]
+        self.empty = False
+        self.accept = 1 << bits[interned.initial] if interned.initial in bits else 0
+        self.terminals: Dict[str, int] = {}
+        # rules A -> B C by B: the mask of every C it pairs with, per A
+        grouped: Dict[int, Dict[int, int]] = {}
+        self.rules: List[Tuple[int, int, int]] = []
+
+        for x, body in zip(interned.heads, interned.bodies):
+            if not body and x == interned.initial:
+                self.empty = True
+            elif len(body) == 1 and body[0] not in bits:
+                t = names[body[0]]
+                self.terminals[t] = self.terminals.get(t, 0) | 1 << bits[x]
+            elif len(body) == 2 and body[0] in bits and body[1] in bits:
+                a, b, c = bits[x], bits[body[0]], bits[body[1]]
+                by_head = grouped.setdefault(b, {})
+                by_head[a] = by_head.get(a, 0) | 1 << c
+                self.rules.append((a, b, c))
+            else:
+                raise ValueError(f'not in Chomsky normal form: {names[x]} -> '
+                                 f"{' '.join(names[y] for y in body)}")
+
+        self.pairs = {b: [(c, 1 << a) for a, c in by_head.items()] for b, by_head in grouped.items()}
+
+    def recognize(self, tokens: Iterable[str], vectorized: Optional[bool] = None) -> bool:
+        # vectorized defaults to NumPy when it is installed
+        tokens = list(tokens)
+        if not tokens:
+            return self.empty
+
+        cells = [self.terminals.get(t, 0) for t in tokens]
+        if not all(cells):
+            return False
+
+        if vectorized is None:
+            vectorized = numpy is not None
+        if vectorized:
+            return self._recognize_vectorized(cells)
+        return bool(self._chart(cells) & self.accept)
+
+    def _chart(self, cells: List[int]) -> int:
+        # chart[l - 1][i]: nonterminals deriving tokens i to i + l - 1
+        n, pairs = len(cells), self.pairs
+        chart = [cells]
+        for length in range(2, n + 1):
+            row = []
+            for i in range(n - length + 1):
+                cell = 0
+                for k in range(1, length):
+                    left = chart[k - 1][i]
+                    right = chart[length - k - 1][i + k]
+                    if not left or not right:
+                        continue
+
+                    while left:
+                        low = left & -left
+                        left ^= low
+                        for mask, head in pairs.get(low.bit_length() - 1, ()):
+                            if right & mask:
+                                cell |= head
+                row.append(cell)
+            chart.append(row)
+        return chart[-1][0]
+
+    def _recognize_vectorized(self, cells: List[int]) -> bool:
+        # one span length at a time, for every start position and split at
+        # once: a rule A -> B C holds where some split has B on the left and
+        # C on the right, and heads are gathered with a boolean matrix
+        # product; chart[l - 1, i] is the row of tokens i to i + l - 1
+        n, size = len(cells), len(self.names)
+        if not self.rules:
+            return n == 1 and bool(cells[0] & self.accept)
+
+        a, b, c = (numpy.array(column) for column in zip(*self.rules))
+        heads = numpy.zeros((len(self.rules), size), dtype=bool)
+        heads[numpy.arange(len(self.rules)), a] = True
+
+        chart = numpy.zeros((n, n, size), dtype=bool)
+        chart[0] = numpy.array(cells, dtype=object)[:, None] >> numpy.arange(size) & 1
+        filled = numpy.zeros((n, n), dtype=bool)
+        filled[0] = True
+        for length in range(2, n + 1):
+            m = n - length + 1
+            # (start, split) pairs, start-major, where both halves derive
+            # something: most are empty, so only those are combined
+            starts = numpy.arange(m)[:, None]
+            splits = numpy.arange(1, length)
+            both = filled[splits - 1, starts] & filled[length - 1 - splits, starts + splits]
+            i, k = numpy.nonzero(both)
+            if not len(i):
+                continue
+            k += 1
+
+            hits = chart[k - 1, i][:, b] & chart[length - 1 - k, i + k][:, c]
+            first = numpy.flatnonzero(numpy.r_[True, i[1:] != i[:-1]])
+            row = numpy.logical_or.reduceat(hits, first) @ heads
+            chart[length - 1, i[first]] = row
+            filled[length - 1, i[first]] = row.any(axis=1)
+
+        start = self.accept.bit_length() - 1
+        return start >= 0 and bool(chart[n - 1, 0, start])
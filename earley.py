@@ -0,0 +1,285 @@
+from itertools import chain
+from typing import Dict, Iterable, Iterator, List, Set, Tuple, Union
+
+from cfg import CFG, _bits
+
+# an item (r, dot, origin) in the set of position i is production r with
+# its body read up to dot, from token origin to token i; a link records how
+# it got there: (item before the dot moved, its position, node read)
+Item = Tuple[int, int, int]
+Link = Tuple[Item, int, Tuple[int, int, int]]
+
+# forest nodes: symbol nodes (symbol, start, end) and intermediate nodes
+# (production, dot, start, end) for a production read up to dot
+Node = Tuple[int, ...]
+Tree = Union[str, Tuple[str, list]]
+
+
+class Forest:
+    # shared packed parse forest over the Earley sets: a nonterminal node
+    # packs the productions completed over its span, and an intermediate
+    # node packs each split into the node before its dot and the symbol
+    # read, so every subtree is stored once however many trees share it
+    __slots__ = ('grammar', 'tokens', 'chart', 'completed', 'root', 'position')
+
+    def __init__(self, grammar: CFG, tokens: List[str], chart: List[Dict[Item, Set[Link]]]):
+        productions = grammar.interned()
+        heads, bodies = productions.heads, productions.bodies
+
+        self.grammar = grammar
+        self.tokens = tokens
+        self.chart = chart
+
+        # completed[i][(x, j)]: productions of x completed from j to i
+        self.completed = []
+        for items in chart:
+            completed = {}
+            for r, dot, j in items:
+                if dot == len(bodies[r]):
+                    completed.setdefault((heads[r], j), []).append(r)
+            self.completed.append(completed)
+
+        root = (productions.initial, 0, len(tokens))
+        read = len(chart) > len(tokens)
+        self.root = root if read and self.packed(root) else None
+        # for rejections, as in ParseResult: the first token no item could
+        # read, or the number of tokens when input ended too early
+        self.position = -1 if self.root else len(chart) - 1
+
+    @property
+    def accepted(self) -> bool:
+        return self.root is not None
+
+    def packed(self, node: Node) -> list:
+        # the alternatives of a node: intermediate nodes for a symbol node,
+        # (before, read) pairs for an intermediate one
+        if len(node) == 3:
+            x, j, i = node
+            bodies = self.grammar.interned().bodies
+            return [(r, len(bodies[r]), j, i) for r in self.completed[i].get((x, j), ())]
+
+        r, dot, j, i = node
+        links = self.chart[i].get((r, dot, j), ())
+        return [((r, dot - 1, j, k), read) for _, k, read in links]
+
+    def label(self, node: Node) -> str:
+        productions = self.grammar.interned()
+        names = productions.symbols.names
+        if len(node) == 3:
+            return names[node[0]]
+
+        r, dot, _, _ = node
+        body = [names[y] for y in productions.bodies[r]]
+        return f"{names[productions.heads[r]]} -> {' '.join(body[:dot] + ['.'] + body[dot:])}"
+
+    def count(self) -> Union[int, float]:
+        # number of parse trees, infinite when a cycle (A -> ... -> A over
+        # the same span) can be taken any number of times
+        if not self.accepted:
+            return 0
+
+        counts: Dict[Node, Union[int, float]] = {}
+        path = set()
+        stack = [(self.root, False)]
+        while stack:
+            node, done = stack.pop()
+            if done:
+                path.discard(node)
+                counts[node] = self._count(node, counts)
+                continue
+
+            if node in counts or node in path:
+                continue
+
+            path.add(node)
+            stack.append((node, True))
+            for child in self._children(node):
+                if child not in counts and child not in path:
+                    stack.append((child, False))
+
+        return counts[self.root]
+
+    def _children(self, node: Node) -> Iterator[Node]:
+        if len(node) == 3:
+            yield from self.packed(node)
+        elif node[1]:
+            for before, read in self.packed(node):
+                yield before
+                yield read
+
+    def _count(self, node: Node, counts: Dict[Node, Union[int, float]]) -> Union[int, float]:
+        # children still missing are on the path from the root: a cycle
+        if len(node) == 3:
+            if node[0] not in self.grammar.interned().nonterminals:
+                return 1
+            return sum(counts.get(child, float('inf')) for child in self.packed(node))
+
+        if not node[1]:
+            return 1
+        return sum(
+            counts.get(before, float('inf')) * counts.get(read, float('inf'))
+            for before, read in self.packed(node)
+        )
+
+    def trees(self) -> Iterator[Tree]:
+        # every parse tree, (nonterminal, children) with terminals as
+        # strings, built one at a time; trees through cycles are left out
+        if self.accepted:
+            yield from self._trees(self.root, frozenset())
+
+    def _trees(self, node: Node, path: frozenset) -> Iterator[Tree]:
+        x = node[0]
+        productions = self.grammar.interned()
+        if x not in productions.nonterminals:
+            yield productions.symbols.names[x]
+            return
+
+        if node in path:
+            return
+
+        path = path | {node}
+        for item in self.packed(node):
+            for children in self._sequences(item, path):
+                yield productions.symbols.names[x], children
+
+    def _sequences(self, node: Node, path: frozenset) -> Iterator[list]:
+        if not node[1]:
+            yield []
+            return
+
+        for before, read in self.packed(node):
+            for children in self._sequences(before, path):
+                for tree in self._trees(read, path):
+                    yield children + [tree]
+
+    def __len__(self):
+        # number of packed alternatives over all nodes
+        return sum(len(links) for items in self.chart for links in items.values())
+
+    def __repr__(self):
+        return f'<Forest accepted={self.accepted} tokens={len(self.tokens)} size={len(self)}>'
+
+
+class Earley:
+    # Earley parser over the interned productions. Predicting a nonterminal
+    # adds at once the productions of every nonterminal it may start with
+    # (its first-nt set), keeping only those that may begin with the next
+    # token or derive '&', so in LL(1)-like regions a single production is
+    # predicted. Nullable nonterminals are stepped over when predicted,
+    # which spares completing items over empty spans (Aycock and Horspool)
+    __slots__ = ('grammar', 'productions', 'analysis', '_predictions')
+
+    def __init__(self, grammar: CFG):
+        self.grammar = grammar
+        self.productions = grammar.interned()
+        self.analysis = grammar.analysis()
+        self._predictions = {}
+
+    def _predict(self, x: int) -> Tuple[Set[int], Dict[int, List[int]], List[int]]:
+        # nonterminals predicted along with x, their productions by the
+        # terminals they may start with, and the nullable ones
+        prediction = self._predictions.get(x)
+        if prediction is None:
+            rules, bodies = self.productions.rules, self.productions.bodies
+            predicted = {x} | self.analysis._first_nt_of(x)
+            by_terminal, nullable = {}, []
+            for y in predicted:
+                for r in rules[y]:
+                    first, empty = self.analysis._first_of(bodies[r])
+                    for t in _bits(first):
+                        by_terminal.setdefault(t, []).append(r)
+                    if empty:
+                        nullable.append(r)
+
+            prediction = self._predictions[x] = predicted, by_terminal, nullable
+        return prediction
+
+    def _chart(self, tokens: List[str], links: bool) -> List[Dict[Item, Set[Link]]]:
+        # the sets of every position read; it stops short of the input at
+        # the first token no item can read
+        productions = self.productions
+        heads, bodies = productions.heads, productions.bodies
+        nonterminals, nullable = productions.nonterminals, self.analysis._nullable
+        ids = productions.symbols.ids
+        words = [ids.get(t, -1) for t in tokens] + [0]
+
+        chart, waiting = [], []
+        items: Dict[Item, Set[Link]] = {}
+        initial = productions.initial
+        if initial in nonterminals:
+            predicted, by_terminal, empty = self._predict(initial)
+            for r in chain(by_terminal.get(words[0], ()), empty):
+                items[(r, 0, 0)] = set()
+
+        def add(table, item, link, worklist=None):
+            known = table.get(item)
+            if known is None:
+                known = table[item] = set()
+                if worklist is not None:
+                    worklist.append(item)
+            if links:
+                known.add(link)
+
+        for i, word in enumerate(words):
+            chart.append(items)
+            following: Dict[Item, Set[Link]] = {}
+            waits: Dict[int, List[Item]] = {}
+            predicted_here = set()
+            waiting.append(waits)
+
+            worklist = list(items)
+            while worklist:
+                item = worklist.pop()
+                r, dot, j = item
+                body = bodies[r]
+
+                if dot == len(body):
+                    # completions over empty spans were stepped over
+                    if j == i:
+                        continue
+                    x = heads[r]
+                    for r2, dot2, j2 in waiting[j].get(x, ()):
+                        add(items, (r2, dot2 + 1, j2), ((r2, dot2, j2), j, (x, j, i)), worklist)
+                    continue
+
+                y = body[dot]
+                if y in nonterminals:
+                    waits.setdefault(y, []).append(item)
+                    if y not in predicted_here:
+                        predicted, by_terminal, empty = self._predict(y)
+                        predicted_here |= predicted
+                        for r2 in chain(by_terminal.get(word, ()), empty):
+                            if (r2, 0, i) not in items:
+                                items[(r2, 0, i)] = set()
+                                worklist.append((r2, 0, i))
+
+                    if y in nullable:
+                        add(items, (r, dot + 1, j), (item, i, (y, i, i)), worklist)
+                elif y == word:
+                    add(following, (r, dot + 1, j), (item, i, (y, i, i + 1)))
+
+            if i == len(tokens) or not following:
+                break
+            items = following
+
+        return chart
+
+    def parse(self, tokens: Iterable[str]) -> Forest:
+        tokens = list(tokens)
+        return Forest(self.grammar, tokens, self._chart(tokens, links=True))
+
+    def recognize(self, tokens: Iterable[str]) -> bool:
+        # LL(1) grammars need no chart at all
+        tokens = list(tokens)
+        if self.grammar.is_ll1():
+            return self.grammar.compiled_table().recognize(tokens)
+
+        chart = self._chart(tokens, links=False)
+        if len(chart) <= len(tokens):
+            return False
+
+        initial = self.productions.initial
+        return any(
+            dot == len(self.productions.bodies[r]) and j == 0 and self.productions.heads[r] == initial
+            for r, dot, j in chart[-1]
+        )
@@ -16,6 +16,7 @@ from PyQt5.QtWidgets import (
         QMenu,
         QMessageBox,
         QPlainTextEdit,
+        QProgressBar,
         QPushButton,
         QShortcut,
         QTableWidget,
@@ -29,7 +30,10 @@ from PyQt5.QtGui import (
         )
 
 from gui.viewers import ParseTableViewer, ParseResultDialog, ParseStepViewer
-from cfg import CFG
+from gui.workers import JobRunner
+from cfg import Diagnostics, instrument
+from compiled import GrammarCache
+from earley import Forest
 from stub import (first, follow, first_nt, as_proper)
 
 
@@ -37,11 +41,83 @@ def sorted_set_str(set_):
     return str(sorted(set_)).replace('[', '{').replace(']', '}')
 
 
+grammar_cache = GrammarCache()
+
+
+def saved_as(text, filename):
+    '''Tells whether text is what the file named filename holds.'''
+    if filename is None:
+        return False
+    try:
+        with open(filename) as f:
+            return f.read() == text
+    except OSError:
+        return False
+
+
+def analyze_grammar(text, previous=None, filename=None, *, checkpoint):
+    '''Loads a grammar and computes its first, follow and firstNT tables,
+       from the grammar cache if this text is that of the file it was
+       loaded from or saved to, otherwise reusing what is still valid from
+       the previous grammar, and reports where the time went. Runs off the
+       main thread, stopping between tables once superseded.'''
+    diagnostics = Diagnostics()
+    with instrument() as report:
+        if saved_as(text, filename):
+            grammar = grammar_cache.load_file(filename, diagnostics)
+        else:
+            grammar = grammar_cache.load_text(text, diagnostics, previous=previous, source=filename)
+        checkpoint()
+        firsts = first(grammar)
+        checkpoint()
+        follows = follow(grammar)
+        checkpoint()
+        first_nts = first_nt(grammar)
+    return grammar, firsts, follows, first_nts, diagnostics, report
+
+
+def check_ll1(grammar, *, checkpoint):
+    '''Reports why grammar is not LL(1), or builds its parsing table if it
+       is. Runs off the main thread.'''
+    report = grammar.ll1_report()
+    if report.is_ll1:
+        checkpoint()
+        grammar.compiled_table()
+    return report
+
+
+def verify(grammar, text, *, checkpoint):
+    '''Parses text with the LL(1) table or, failing that, the LALR(1) one,
+       giving the parse trace, or with Earley, giving the parse forest, when
+       grammar is neither. Runs off the main thread.'''
+    if grammar.is_ll1():
+        checkpoint()
+        return grammar.trace(text)
+    checkpoint()
+    if not grammar.lalr_table().conflicts:
+        checkpoint()
+        return grammar.lalr_trace(text)
+    checkpoint()
+    return grammar.parse_forest(text)
+
+
+def make_proper(grammar, *, checkpoint):
+    '''Transforms grammar into a proper grammar and renders it back as
+       editor text. Runs off the main thread.'''
+    grammar = as_proper(grammar)
+    checkpoint()
+    text = ''
+    for line in str(grammar).splitlines()[1:-1]:
+        text += line.strip() + '\n'
+    return grammar, text
+
+
 class GLCEditor:
     def __init__(self):
         '''Initializes editor.'''
         self.grammar = None
         self.filename = None
+        self.analyzing = False
 
         self.app = QApplication(sys.argv)
         self.window = QMainWindow()
@@ -54,6 +130,27 @@ class GLCEditor:
         self.window.statusBar()
         self.window.statusBar().showMessage('Done.')
 
+        self.jobs = JobRunner(self.window)
+        self.jobs.started.connect(self.job_started)
+        self.jobs.stopped.connect(self.job_stopped)
+
+        def build_status_bar():
+            '''Builds the busy indicator shown while a job runs.'''
+            self.progress_bar = QProgressBar()
+            self.progress_bar.setRange(0, 0)
+            self.progress_bar.setMaximumWidth(120)
+            self.progress_bar.hide()
+
+            self.cancel_job_btn = QPushButton('Cancel')
+            self.cancel_job_btn.clicked.connect(self.cancel_job)
+            self.cancel_job_btn.hide()
+
+            cancel_shortcut = QShortcut(QKeySequence('Esc'), self.window)
+            cancel_shortcut.activated.connect(self.cancel_job)
+
+            self.window.statusBar().addPermanentWidget(self.progress_bar)
+            self.window.statusBar().addPermanentWidget(self.cancel_job_btn)
+
         def build_menu_bar():
             '''Builds menu bar items.'''
             menu_bar = self.window.menuBar()
@@ -102,6 +199,7 @@ class GLCEditor:
             self.editor = QPlainTextEdit()
             self.editor.setTabChangesFocus(True)
             self.editor.textChanged.connect(self.enable_run_grammar)
+            self.editor.textChanged.connect(self.cancel_job)
 
             self.run_grammar_btn = QPushButton('Run grammar')
             self.run_grammar_btn.clicked.connect(self.update_grammar)
@@ -147,6 +245,7 @@ class GLCEditor:
             contents.addLayout(left_side)
             contents.addLayout(right_side)
 
+        build_status_bar()
         build_menu_bar()
         build_contents()
         self.make_proper_item.setEnabled(False)
@@ -179,6 +278,8 @@ class GLCEditor:
         self.window.setWindowTitle(f'{self.filename} - Context-Free Grammar Editor')
         with open(filename) as f:
             self.editor.setPlainText(f.read())
+        # known grammars come straight from the grammar cache
+        self.update_grammar()
 
     def save_cfg(self):
         '''Saves GFC. If no filename exists, shows save dialog.'''
@@ -203,36 +304,106 @@ class GLCEditor:
             f.write(self.editor.toPlainText())
             f.close()
 
+    def job_started(self, description):
+        '''Shows that a background job is running.'''
+        self.window.statusBar().showMessage(description)
+        self.progress_bar.show()
+        self.cancel_job_btn.show()
+
+    def job_stopped(self):
+        '''Hides the background job indicator.'''
+        self.progress_bar.hide()
+        self.cancel_job_btn.hide()
+
+    def job_failed(self, error):
+        '''Reports a background job that raised.'''
+        traceback.print_tb(error.__traceback__)
+        self.window.statusBar().showMessage(f'Failed: {error}')
+
+    def cancel_job(self):
+        '''Cancels the running background job, if any.'''
+        if not self.jobs.busy:
+            return
+        self.jobs.cancel()
+        self.window.statusBar().showMessage('Cancelled.')
+
+    def set_analyzing(self, analyzing):
+        '''Keeps the actions on the current grammar off while the editor
+           text is being analyzed, so that none of them supersedes the
+           analysis or runs on the grammar it is about to replace.'''
+        self.analyzing = analyzing
+        ready = not analyzing and self.grammar is not None
+        self.verify_test_btn.setEnabled(not analyzing)
+        self.make_proper_item.setEnabled(ready)
+        self.parse_table_item.setEnabled(ready)
+
     def make_grammar_proper(self):
         '''Transforms current grammar into a proper grammar.'''
-        self.grammar = as_proper(self.grammar)
-        text = ''
-        for line in str(self.grammar).splitlines()[1:-1]:
-            text += line.strip() + '\n'
+        self.jobs.submit('Making grammar proper...',
+                         make_proper, self.grammar,
+                         on_done=self.grammar_made_proper,
+                         on_error=self.job_failed)
+
+    def grammar_made_proper(self, result):
+        '''Shows the proper grammar in the editor.'''
+        self.grammar, text = result
         self.editor.setPlainText(text)
+        self.window.statusBar().showMessage('Done.')
 
     def verify_test_string(self):
         '''Verifies if test input string belongs to language.'''
+        if self.analyzing:
+            return
         if self.grammar is None:
-            result = 'Grammar input not valid.'
-        steps = []
-        try:
-            for step in self.grammar.parse(self.test_string_edit.text()):
-                steps.append(step)
-            result = 'Accept'
-        except ValueError as e:
-            result = 'Reject'
+            ParseResultDialog(self.window, 'Grammar input not valid.').show()
+            return
+
+        self.jobs.submit('Parsing test string...',
+                         verify, self.grammar, self.test_string_edit.text(),
+                         on_done=self.show_parse_result,
+                         on_error=self.job_failed)
+
+    def show_parse_result(self, trace):
+        '''Shows the parse verdict and, if asked, its steps. Without a
+           deterministic parser there are no steps, only how many parse
+           trees there are.'''
+        self.window.statusBar().showMessage('Done.')
+        if isinstance(trace, Forest):
+            if not trace.accepted:
+                QMessageBox.information(self.window, 'Test result',
+                                        f'Reject (at token {trace.position + 1})')
+                return
+
+            count = trace.count()
+            trees = 'infinitely many' if count == float('inf') else count
+            QMessageBox.information(self.window, 'Test result',
+                                    f'Accept ({trees} parse tree{"s" if count != 1 else ""})')
+            return
+
+        result = 'Accept' if trace.accepted else 'Reject'
 
         if ParseResultDialog(self.window, result).show() == 1:
-            ParseStepViewer(self.window, steps).show()
+            ParseStepViewer(self.window, trace).show()
 
     def show_parse_table(self):
         '''Shows LL(1) parsing table.'''
-        if not self.grammar.is_ll1():
-            QMessageBox.information(self.window,
-                                    'Error showing parsing table',
-                                    'Grammar is not LL(1).',
-                                    QMessageBox.Ok)
+        self.jobs.submit('Building parsing table...',
+                         check_ll1, self.grammar,
+                         on_done=self.parse_table_ready,
+                         on_error=self.job_failed)
+
+    def parse_table_ready(self, report):
+        '''Shows the parsing table built in the background, or why the
+           grammar is not LL(1).'''
+        self.window.statusBar().showMessage('Done.')
+        if not report.is_ll1:
+            reasons = str(report).splitlines()
+            msg_box = QMessageBox(self.window)
+            msg_box.setWindowTitle('Error showing parsing table')
+            msg_box.setText('Grammar is not LL(1).')
+            msg_box.setInformativeText('\n'.join(reasons[:5] + (['...'] if len(reasons) > 5 else [])))
+            msg_box.setDetailedText(str(report))
+            msg_box.exec_()
             return
         ParseTableViewer(self.window, self.grammar).show()
 
@@ -241,41 +412,57 @@ class GLCEditor:
         self.run_grammar_btn.setEnabled(True)
 
     def update_grammar(self):
-        '''Updates grammar with given input and then updates UI.
-           If it fails to generate the grammar, nothing happens.'''
-        try:
-            self.grammar = CFG.load(self.editor.toPlainText().splitlines())
-        except Exception as e:
-            traceback.print_tb(e.__traceback__)
-            self.window.statusBar().showMessage('Failed to generate grammar. Check your syntax.')
-            #self.make_proper_item.setEnabled(False)
-            #self.parse_table_item.setEnabled(False)
-            return
-
-        self.window.statusBar().showMessage('Done.')
-        self.make_proper_item.setEnabled(True)
-        self.parse_table_item.setEnabled(True)
+        '''Updates grammar with given input and then updates UI. Analysis
+           runs in the background; if it fails to generate the grammar,
+           nothing happens.'''
+        # submitting cancels a previous analysis, which turns the actions
+        # back on, so they are only turned off afterwards
+        self.jobs.submit('Analyzing grammar...',
+                         analyze_grammar, self.editor.toPlainText(), self.grammar, self.filename,
+                         on_done=self.grammar_updated,
+                         on_error=self.grammar_failed,
+                         on_cancel=self.analysis_cancelled)
         self.run_grammar_btn.setEnabled(False)
-        try:
-            self.update_tables()
-        except RecursionError as e:
-            self.window.statusBar().showMessage('Failed to generate grammar tables: Recursion depth overflow.')
-            #self.make_proper_item.setEnabled(False)
-            #self.parse_table_item.setEnabled(False)
-            return
+        self.set_analyzing(True)
+
+    def grammar_updated(self, result):
+        '''Installs a freshly analyzed grammar and updates UI.'''
+        self.grammar, firsts, follows, first_nts, diagnostics, report = result
+
+        if diagnostics.count:
+            first_problem = next(iter(diagnostics))
+            message = (f'Done, {diagnostics.count} problems found '
+                       f'(line {first_problem.line}: {first_problem.message}).')
+        else:
+            message = 'Done.'
+        self.window.statusBar().showMessage(f'{message} {report.summary()}')
+        self.set_analyzing(False)
+        self.update_tables(firsts, follows, first_nts)
+
+    def grammar_failed(self, error):
+        '''Reports a grammar that could not be generated.'''
+        traceback.print_tb(error.__traceback__)
+        self.run_grammar_btn.setEnabled(True)
+        self.set_analyzing(False)
+        self.window.statusBar().showMessage('Failed to generate grammar. Check your syntax.')
+
+    def analysis_cancelled(self):
+        '''Lets the text be run again after its analysis was cancelled or
+           superseded, keeping the grammar analyzed before.'''
+        self.run_grammar_btn.setEnabled(True)
+        self.set_analyzing(False)
 
-    def update_tables(self):
+    def update_tables(self, firsts, follows, first_nts):
         '''Updates first, follow and firstNT tables.'''
-        self.update_first_table()
-        self.update_follow_table()
-        self.update_first_nt_table()
+        self.update_first_table(firsts)
+        self.update_follow_table(follows)
+        self.update_first_nt_table(first_nts)
 
-    def update_first_table(self):
+    def update_first_table(self, firsts):
         '''Updates table containing the `first(NT)` of each non-terminal NT.'''
         self.first_table.clear()
         s = self.grammar.initial_symbol
         non_terminals = [s] + sorted(self.grammar.nonterminals - {s})
-        firsts = first(self.grammar)
 
         self.first_table.setRowCount(len(non_terminals))
         self.first_table.setColumnCount(2)
@@ -287,13 +474,12 @@ class GLCEditor:
 
         self.first_table.resizeColumnsToContents()
 
-    def update_follow_table(self):
+    def update_follow_table(self, follows):
         '''Updates table containing the `follow(NT)` of each non-terminal
            NT.'''
         self.follow_table.clear()
         s = self.grammar.initial_symbol
         non_terminals = [s] + sorted(self.grammar.nonterminals - {s})
-        follows = follow(self.grammar)
 
         self.follow_table.setRowCount(len(non_terminals))
         self.follow_table.setColumnCount(2)
@@ -305,13 +491,12 @@ class GLCEditor:
 
         self.follow_table.resizeColumnsToContents()
 
-    def update_first_nt_table(self):
+    def update_first_nt_table(self, first_nts):
         '''Updates table containing the `firstNT(NT)` of each non-terminal
            NT.'''
         self.first_nt_table.clear()
         s = self.grammar.initial_symbol
         non_terminals = [s] + sorted(self.grammar.nonterminals - {s})
-        first_nts = first_nt(self.grammar)
 
         self.first_nt_table.setRowCount(len(non_terminals))
         self.first_nt_table.setColumnCount(2)
@@ -1,16 +1,54 @@
+from PyQt5.QtCore import (
+        QAbstractTableModel,
+        QModelIndex,
+        Qt,
+        )
 from PyQt5.QtWidgets import (
         QAbstractScrollArea,
         QAbstractItemView,
         QDialog,
         QMessageBox,
         QPushButton,
-        QTableWidget,
-        QTableWidgetItem,
+        QTableView,
         QVBoxLayout,
         )
 
-import string
-from stub import build_parse_table
+
+class ParseTableModel(QAbstractTableModel):
+    '''Serves the cells of a compiled LL(1) table on demand. Rows are the
+       nonterminals and columns the terminals (plus `$`), both in the
+       table's own id order, so a cell is a single array lookup.'''
+    def __init__(self, table, parent=None):
+        super(ParseTableModel, self).__init__(parent)
+        self.table = table
+        self.n_terminals = table.n_terminals
+        self.n_nonterminals = len(table.symbols) - table.n_terminals
+
+    def rowCount(self, parent=QModelIndex()):
+        return 0 if parent.isValid() else self.n_nonterminals
+
+    def columnCount(self, parent=QModelIndex()):
+        return 0 if parent.isValid() else self.n_terminals + 1
+
+    def data(self, index, role=Qt.DisplayRole):
+        if role != Qt.DisplayRole or not index.isValid():
+            return None
+
+        row, col = index.row(), index.column()
+        if col == 0:
+            return self.table.symbols[self.n_terminals + row]
+
+        rule = self.table.cells[row * self.n_terminals + col - 1]
+        return self.table.productions[rule] if rule >= 0 else None
+
+    def headerData(self, section, orientation, role=Qt.DisplayRole):
+        if role != Qt.DisplayRole:
+            return None
+
+        if orientation == Qt.Vertical:
+            return str(section + 1)
+
+        return 'NT' if section == 0 else self.table.symbols[section - 1]
 
 
 class ParseTableViewer(QDialog):
@@ -22,30 +60,12 @@ class ParseTableViewer(QDialog):
 
         layout = QVBoxLayout(self)
 
-        self.table = QTableWidget()
-
-        def build_table():
-            parse = build_parse_table(grammar)
-
-            states = [grammar.initial_symbol] + sorted(grammar.nonterminals - {grammar.initial_symbol})
-
-            symbols = sorted(grammar.terminals) + ['$']
-
-            self.table.setRowCount(len(states))
-            self.table.setColumnCount(len(symbols) + 1)
+        self.model = ParseTableModel(grammar.compiled_table(), self)
 
-            self.table.setHorizontalHeaderLabels(['NT'] + symbols)
-            self.table.setEditTriggers(QAbstractItemView.NoEditTriggers)
-
-            for row, state in enumerate(states):
-                self.table.setItem(row, 0, QTableWidgetItem(state))
-
-            for (state, symbol) in parse:
-                self.table.setItem(states.index(state),
-                                   symbols.index(symbol) + 1,
-                                   QTableWidgetItem(f'{parse[(state, symbol)]}'))
+        self.table = QTableView()
+        self.table.setModel(self.model)
+        self.table.setEditTriggers(QAbstractItemView.NoEditTriggers)
 
-        build_table()
         layout.addWidget(self.table)
 
 
@@ -62,30 +82,69 @@ class ParseResultDialog(QDialog):
     def show(self):
         return self.msg_box.exec_()
 
+
+class ParseStepModel(QAbstractTableModel):
+    '''Serves parse steps on demand, rebuilding each visible step from the
+       parse trace. The last rebuilt step is kept since views ask for both
+       of its columns in a row.'''
+    def __init__(self, trace, parent=None):
+        super(ParseStepModel, self).__init__(parent)
+        self.trace = trace
+        self.last_row, self.last_step = -1, None
+
+    def rowCount(self, parent=QModelIndex()):
+        return 0 if parent.isValid() else len(self.trace)
+
+    def columnCount(self, parent=QModelIndex()):
+        return 0 if parent.isValid() else 2
+
+    def data(self, index, role=Qt.DisplayRole):
+        if role != Qt.DisplayRole or not index.isValid():
+            return None
+
+        if index.row() != self.last_row:
+            self.last_row, self.last_step = index.row(), self.trace[index.row()]
+
+        right, left = self.last_step
+        if index.column() == 0:
+            return '$' + ''.join(left)
+        return ''.join(right) + '$'
+
+    def headerData(self, section, orientation, role=Qt.DisplayRole):
+        if role != Qt.DisplayRole:
+            return None
+
+        if orientation == Qt.Vertical:
+            return str(section + 1)
+
+        return ('Stack', 'Input')[section]
+
+
 class ParseStepViewer(QDialog):
-    def __init__(self, parent, steps):
+    def __init__(self, parent, trace):
         super(ParseStepViewer, self).__init__(parent)
         self.setModal(True)
         self.setWindowTitle('Parse steps view.')
         self.resize(640, 480)
 
         layout = QVBoxLayout(self)
-        self.table = QTableWidget()
-        self.table.setColumnCount(2)
-        self.table.setRowCount(len(steps))
-        self.table.setEditTriggers(QAbstractItemView.NoEditTriggers)
-        self.table.setSizeAdjustPolicy(QAbstractScrollArea.AdjustToContents)
 
-        self.table.setHorizontalHeaderLabels(['Stack', 'Input'])
+        self.model = ParseStepModel(trace, self)
 
-        for row, (right, left) in enumerate(steps):
-            self.table.setItem(row, 0, QTableWidgetItem('$' + ''.join(left)))
-            self.table.setItem(row, 1, QTableWidgetItem(''.join(right) + '$'))
-
-        self.table.resizeColumnsToContents()
+        self.table = QTableView()
+        self.table.setModel(self.model)
+        self.table.setEditTriggers(QAbstractItemView.NoEditTriggers)
+        self.table.setSizeAdjustPolicy(QAbstractScrollArea.AdjustToContents)
+        # columns are sized from the rows in view only, each of which is
+        # rebuilt from the trace; there are none until the dialog is shown
+        self.table.horizontalHeader().setResizeContentsPrecision(0)
 
         ok_btn = QPushButton('&Close')
         ok_btn.clicked.connect(self.close)
 
         layout.addWidget(self.table)
         layout.addWidget(ok_btn)
+
+    def showEvent(self, event):
+        super(ParseStepViewer, self).showEvent(event)
+        self.table.resizeColumnsToContents()
@@ -0,0 +1,113 @@
+from PyQt5.QtCore import (
+        QObject,
+        QRunnable,
+        QThreadPool,
+        pyqtSignal,
+        )
+
+
+class Cancelled(Exception):
+    '''Raised at a checkpoint of a job that was superseded.'''
+
+
+class JobSignals(QObject):
+    finished = pyqtSignal(int, object)
+    failed = pyqtSignal(int, object)
+
+
+class Job(QRunnable):
+    '''Runs `fn(*args, checkpoint=...)` on a pool thread and reports back
+       through signals, tagged with the generation it was submitted in.
+       fn calls checkpoint() between its phases, so that a superseded job
+       stops there instead of running to the end.'''
+    def __init__(self, generation, fn, *args):
+        super(Job, self).__init__()
+        # lifetime is managed from Python, so the runner may still refer to
+        # a job the pool has already run
+        self.setAutoDelete(False)
+        self.generation = generation
+        self.fn = fn
+        self.args = args
+        self.signals = JobSignals()
+        self.cancelled = False
+
+    def checkpoint(self):
+        if self.cancelled:
+            raise Cancelled()
+
+    def run(self):
+        try:
+            result = self.fn(*self.args, checkpoint=self.checkpoint)
+        except Cancelled:
+            pass
+        except Exception as e:
+            self.signals.failed.emit(self.generation, e)
+        else:
+            self.signals.finished.emit(self.generation, result)
+
+
+class JobRunner(QObject):
+    '''Runs one job at a time off the main thread. Submitting a job or
+       cancelling supersedes the current one: a job still queued is taken
+       back from the pool, a running one is told to stop at its next
+       checkpoint and its result, if it still arrives, is dropped. Whatever
+       ends a job calls exactly one of its on_done, on_error or on_cancel
+       handlers.'''
+    started = pyqtSignal(str)
+    stopped = pyqtSignal()
+
+    def __init__(self, parent=None):
+        super(JobRunner, self).__init__(parent)
+        self.pool = QThreadPool.globalInstance()
+        self.generation = 0
+        self.job = None
+        self.on_done = None
+        self.on_error = None
+        self.on_cancel = None
+
+    @property
+    def busy(self):
+        return self.job is not None
+
+    def submit(self, description, fn, *args, on_done, on_error=None, on_cancel=None):
+        self.cancel()
+
+        self.generation += 1
+        self.job = Job(self.generation, fn, *args)
+        self.job.signals.finished.connect(self._finished)
+        self.job.signals.failed.connect(self._failed)
+        self.on_done, self.on_error, self.on_cancel = on_done, on_error, on_cancel
+
+        self.started.emit(description)
+        self.pool.start(self.job)
+
+    def cancel(self):
+        if self.job is None:
+            return
+
+        self.job.cancelled = True
+        self.pool.tryTake(self.job)
+        self.generation += 1
+        self.job = None
+        self.stopped.emit()
+
+        if self.on_cancel is not None:
+            self.on_cancel()
+
+    def _take(self, generation):
+        if generation != self.generation or self.job is None:
+            return None
+
+        self.job = None
+        self.stopped.emit()
+        return self.on_done, self.on_error
+
+    def _finished(self, generation, result):
+        handlers = self._take(generation)
+        if handlers is not None:
+            handlers[0](result)
+
+    def _failed(self, generation, error):
+        handlers = self._take(generation)
+        if handlers is not None and handlers[1] is not None:
+            handlers[1](error)
@@ -0,0 +1,430 @@
+from array import array
+from itertools import chain, islice
+from typing import Dict, Iterable, Iterator, List, NamedTuple, Optional, Set, Tuple
+
+from cfg import ACCEPTED, CFG, ParseResult, _bits, _closure, _report
+
+# an LR(0) item (r, dot) is production r with its body read up to dot;
+# production len(bodies) - 1 is the augmented S' -> S, whose reduction on
+# '$' accepts
+Item = Tuple[int, int]
+
+
+class LRConflict(NamedTuple):
+    state: int
+    terminal: str
+    # shift/reduce (resolved as a shift) or reduce/reduce (resolved as the
+    # production listed first), as yacc does
+    kind: str
+    productions: Tuple[str, ...]
+
+
+class LRAutomaton:
+    # LR(0) states with LALR(1) lookaheads. Lookaheads are found once per
+    # state: the closure of its kernel runs with lookahead sets holding
+    # terminals, generated spontaneously from first sets, and markers ~k
+    # for whatever kernel item k will get, which become propagation edges
+    # between kernel items, followed to a fixed point at the end
+    __slots__ = (
+        'productions', 'bodies', 'accept', 'kernels', 'transitions',
+        'reductions', '_leading', '_entered',
+    )
+
+    def __init__(self, grammar: CFG):
+        productions = grammar.interned()
+        analysis = grammar.analysis()
+        nonterminals, rules = productions.nonterminals, productions.rules
+
+        self.productions = productions
+        self.bodies = bodies = productions.bodies + [(productions.initial,)]
+        self.accept = accept = len(bodies) - 1
+
+        # nonterminals whose productions a state gets along with x
+        self._leading = {x: set() for x in nonterminals}
+        for x, body in zip(productions.heads, productions.bodies):
+            if body and body[0] in nonterminals:
+                self._leading[x].add(body[0])
+        self._entered: Dict[int, Set[int]] = {}
+
+        self.kernels: List[Tuple[Item, ...]] = [((accept, 0),)]
+        self.transitions: List[Dict[int, int]] = []
+        index = {self.kernels[0]: 0}
+        # lookaheads of kernel items, by state and item
+        lookaheads: List[Dict[Item, Set[int]]] = [{(accept, 0): {0}}]
+        propagation: Dict[Tuple[int, Item], List[Tuple[int, Item]]] = {}
+
+        state = 0
+        while state < len(self.kernels):
+            kernel = self.kernels[state]
+            successors: Dict[int, List[Item]] = {}
+            for r, dot in self.closure(kernel):
+                body = bodies[r]
+                if dot < len(body):
+                    successors.setdefault(body[dot], []).append((r, dot + 1))
+
+            transitions = {}
+            for x, items in successors.items():
+                target = tuple(sorted(items))
+                if target not in index:
+                    index[target] = len(self.kernels)
+                    self.kernels.append(target)
+                    lookaheads.append({item: set() for item in target})
+                transitions[x] = index[target]
+            self.transitions.append(transitions)
+
+            # the closure again, now carrying lookaheads
+            markers = {item: {~k} for k, item in enumerate(kernel)}
+            worklist = list(kernel)
+            while worklist:
+                r, dot = worklist.pop()
+                body = bodies[r]
+                if dot >= len(body) or body[dot] not in nonterminals:
+                    continue
+
+                first, nullable = analysis._first_of(body[dot + 1:])
+                follow = set(_bits(first))
+                if nullable:
+                    follow |= markers[(r, dot)]
+                for r2 in rules[body[dot]]:
+                    known = markers.setdefault((r2, 0), set())
+                    if not follow <= known:
+                        known |= follow
+                        worklist.append((r2, 0))
+
+            for (r, dot), carried in markers.items():
+                body = bodies[r]
+                if dot < len(body):
+                    target, item = transitions[body[dot]], (r, dot + 1)
+                elif dot == 0:
+                    # completed but not in the kernel: an empty production,
+                    # reduced here on what its markers resolve to
+                    target, item = state, (r, 0)
+                    lookaheads[state].setdefault(item, set())
+                else:
+                    continue
+
+                for e in carried:
+                    if e >= 0:
+                        lookaheads[target][item].add(e)
+                    else:
+                        propagation.setdefault((state, kernel[~e]), []).append((target, item))
+
+            state += 1
+
+        worklist = [(s, item) for s, items in enumerate(lookaheads) for item in items]
+        while worklist:
+            source = worklist.pop()
+            carried = lookaheads[source[0]][source[1]]
+            for s, item in propagation.get(source, ()):
+                known = lookaheads[s][item]
+                if not carried <= known:
+                    known |= carried
+                    worklist.append((s, item))
+
+        # completed items of each state and their lookaheads
+        self.reductions: List[Dict[int, Set[int]]] = [
+            {r: la for (r, dot), la in items.items() if dot == len(bodies[r])}
+            for items in lookaheads
+        ]
+
+    def closure(self, kernel: Iterable[Item]) -> List[Item]:
+        nonterminals, rules = self.productions.nonterminals, self.productions.rules
+        items = list(kernel)
+        wanted = set()
+        for r, dot in items:
+            body = self.bodies[r]
+            if dot < len(body) and body[dot] in nonterminals:
+                x = body[dot]
+                if x not in self._entered:
+                    self._entered[x] = _closure({x}, self._leading)
+                wanted |= self._entered[x]
+        items.extend((r, 0) for x in sorted(wanted) for r in rules[x])
+        return items
+
+    def __len__(self):
+        return len(self.kernels)
+
+
+class LRTable:
+    # LALR(1) ACTION and GOTO tables. Terminals (then '$') and nonterminals
+    # get columns of their own; an action is 0 for errors, s + 1 to shift
+    # to state s and -(r + 1) to reduce by production r. States sharing a
+    # row share its storage: rows[s] is where the row of s starts
+    __slots__ = (
+        'symbols', 'tokens', 'n_terminals', 'end', 'productions', 'heads',
+        'lengths', 'accept', 'accessing', 'rows', 'actions', 'goto_rows',
+        'gotos', 'conflicts',
+    )
+
+    def __init__(self, grammar: CFG):
+        automaton = LRAutomaton(grammar)
+        productions = automaton.productions
+        names = productions.symbols.names
+
+        s = grammar.initial_symbol
+        terminals = sorted(grammar.terminals - {'$'}) + ['$']
+        nonterminals = [s] + sorted(grammar.nonterminals - {s})
+        columns = {productions.symbols.ids[x]: i for i, x in enumerate(terminals + nonterminals)}
+
+        self.symbols = terminals + nonterminals
+        self.tokens = {x: i for i, x in enumerate(terminals[:-1])}
+        self.n_terminals = n = len(terminals)
+        self.end = n - 1
+        self.productions = [
+            f'{names[x]} -> {p}' for x, p in zip(productions.heads, productions.sources)
+        ] + [f"{s}' -> {s}"]
+        self.heads = array('i', [columns[x] - n for x in productions.heads] + [-1])
+        self.lengths = array('i', map(len, automaton.bodies))
+        self.accept = automaton.accept
+        self.conflicts: List[LRConflict] = []
+
+        # accessing[s]: the symbol read to enter state s
+        self.accessing = ['$'] * len(automaton)
+        for transitions in automaton.transitions:
+            for x, target in transitions.items():
+                self.accessing[target] = names[x]
+
+        # rows are built sparsely, from the transitions and reductions of
+        # each state, and only spread out once told apart
+        actions, gotos = [], []
+        for state, transitions in enumerate(automaton.transitions):
+            row, goto = {}, []
+            for x, target in transitions.items():
+                if x in productions.nonterminals:
+                    goto.append((columns[x] - n, target))
+                else:
+                    row[columns[x]] = target + 1
+
+            for r, lookaheads in sorted(automaton.reductions[state].items()):
+                for t in lookaheads:
+                    col = columns[t]
+                    if col not in row:
+                        row[col] = -(r + 1)
+                    else:
+                        self._conflict(automaton, state, t, row[col], r)
+
+            actions.append(tuple(sorted(row.items())))
+            gotos.append(tuple(sorted(goto)))
+
+        self.rows, self.actions = _packed_rows(actions, n, 0)
+        self.goto_rows, self.gotos = _packed_rows(gotos, len(nonterminals), -1)
+
+    def _conflict(self, automaton: LRAutomaton, state: int, t: int, current: int, r: int):
+        if current > 0:
+            # the productions of every item of the state reading t
+            shifting = sorted({
+                rule for rule, dot in automaton.closure(automaton.kernels[state])
+                if dot < len(automaton.bodies[rule]) and automaton.bodies[rule][dot] == t
+            })
+            kind, involved = 'shift/reduce', [r] + shifting
+        else:
+            kind, involved = 'reduce/reduce', [-current - 1, r]
+
+        self.conflicts.append(LRConflict(
+            state=state,
+            terminal=automaton.productions.symbols.names[t],
+            kind=kind,
+            productions=tuple(self.productions[p] for p in involved),
+        ))
+
+    def action(self, state: int, terminal: str) -> Optional[str]:
+        # the cell of the ACTION table, written as yacc prints it
+        col = self.tokens.get(terminal, self.end if terminal == '$' else -1)
+        if col < 0:
+            return None
+
+        a = self.actions[self.rows[state] + col]
+        if a > 0:
+            return f'shift {a - 1}'
+        if a < 0:
+            return 'accept' if -a - 1 == self.accept else f'reduce {self.productions[-a - 1]}'
+        return None
+
+    def goto(self, state: int, nonterminal: str) -> Optional[int]:
+        col = self.symbols.index(nonterminal) - self.n_terminals if nonterminal in self.symbols else -1
+        if col < 0:
+            return None
+        target = self.gotos[self.goto_rows[state] + col]
+        return target if target >= 0 else None
+
+    def check(self, tokens: Iterable[str]) -> ParseResult:
+        report = _report()
+        if report is None:
+            return self._check(tokens)
+
+        with report.timing('parse'):
+            tokens = list(tokens)
+            reductions = [0]
+            result = self._check(tokens, reductions)
+            report.parsed(len(tokens) if result.accepted else result.position, reductions[0])
+        return result
+
+    def _check(self, tokens: Iterable[str], reductions: Optional[List[int]] = None) -> ParseResult:
+        ids, rows, actions = self.tokens, self.rows, self.actions
+        goto_rows, gotos, heads, lengths = self.goto_rows, self.gotos, self.heads, self.lengths
+        stack = [0]
+
+        # None marks the end of the sentence
+        for i, token in enumerate(chain(tokens, (None,))):
+            front = ids.get(token, -1) if token is not None else self.end
+
+            # reduce until the token is shifted
+            a = actions[rows[stack[-1]] + front] if front >= 0 else 0
+            while a < 0:
+                r = -a - 1
+                if r == self.accept:
+                    return ACCEPTED
+
+                if lengths[r]:
+                    del stack[-lengths[r]:]
+                stack.append(gotos[goto_rows[stack[-1]] + heads[r]])
+                if reductions is not None:
+                    reductions[0] += 1
+                a = actions[rows[stack[-1]] + front]
+
+            if a == 0:
+                return ParseResult(
+                    accepted=False,
+                    position=i,
+                    top=self.accessing[stack[-1]],
+                    lookahead='$' if token is None else token,
+                )
+
+            stack.append(a - 1)
+
+        return ACCEPTED
+
+    def recognize(self, tokens: Iterable[str]) -> bool:
+        return self.check(tokens).accepted
+
+    def trace(self, tokens: List[str], interval: int = 256) -> 'LRTrace':
+        report = _report()
+        if report is None:
+            return self._trace(tokens, interval)
+
+        with report.timing('parse'):
+            trace = self._trace(tokens, interval)
+            shifts = trace.actions.count(LRTrace.SHIFT)
+            report.parsed(shifts, len(trace.actions) - shifts)
+        return trace
+
+    def _trace(self, tokens: List[str], interval: int) -> 'LRTrace':
+        ids, rows, actions = self.tokens, self.rows, self.actions
+        goto_rows, gotos, heads, lengths = self.goto_rows, self.gotos, self.heads, self.lengths
+        trace = LRTrace(self, tokens, interval)
+        steps, checkpoints = trace.actions, trace.checkpoints
+
+        # tokens unknown to the grammar get -1, which no action reads
+        sentence = [ids.get(t, -1) for t in tokens] + [self.end]
+        stack = [0]
+        i = 0
+
+        while True:
+            if len(steps) % interval == 0:
+                checkpoints.append((tuple(stack), i))
+
+            front = sentence[i]
+            a = actions[rows[stack[-1]] + front] if front >= 0 else 0
+
+            if a > 0:
+                stack.append(a - 1)
+                i += 1
+                steps.append(LRTrace.SHIFT)
+
+            elif a < 0:
+                r = -a - 1
+                if r == self.accept:
+                    break
+
+                if lengths[r]:
+                    del stack[-lengths[r]:]
+                stack.append(gotos[goto_rows[stack[-1]] + heads[r]])
+                steps.append(r)
+
+            else:
+                trace.error = (f'there is no action on {trace.lookahead(i)} '
+                               f'in state {stack[-1]} (after {self.accessing[stack[-1]]})')
+                break
+
+        return trace
+
+
+def _packed_rows(rows: List[Tuple[Tuple[int, int], ...]], width: int, blank: int) -> Tuple[array, array]:
+    # rows given as (column, cell) pairs, the other cells being blank;
+    # equal rows are stored once, width cells each
+    offsets, starts, cells = array('i'), {}, array('i')
+    for row in rows:
+        start = starts.get(row)
+        if start is None:
+            start = starts[row] = len(cells)
+            cells.extend([blank] * width)
+            for col, cell in row:
+                cells[start + col] = cell
+        offsets.append(start)
+    return offsets, cells
+
+
+class LRTrace:
+    # one action per parse step, as in ParseTrace: SHIFT for a shifted
+    # token, otherwise the id of the production reduced; the stack and
+    # input of any step are rebuilt by replaying from the closest checkpoint
+    SHIFT = -1
+
+    __slots__ = ('table', 'tokens', 'interval', 'actions', 'checkpoints', 'error')
+
+    def __init__(self, table: LRTable, tokens: List[str], interval: int):
+        self.table = table
+        self.tokens = tokens
+        self.interval = interval
+        self.actions = array('i')
+        self.checkpoints = []
+        self.error = None
+
+    @property
+    def accepted(self) -> bool:
+        return self.error is None
+
+    def lookahead(self, i: int) -> str:
+        return self.tokens[i] if i < len(self.tokens) else '$'
+
+    def __len__(self):
+        return len(self.actions) + 1
+
+    def __getitem__(self, step: int) -> Tuple[List[str], List[str]]:
+        if step < 0:
+            step += len(self)
+        if not 0 <= step < len(self):
+            raise IndexError('parse step out of range')
+
+        k = step // self.interval
+        stack, i = self.checkpoints[k]
+        stack = list(stack)
+        for action in islice(self.actions, k * self.interval, step):
+            i = self._replay(stack, i, action)
+
+        return self._snapshot(stack, i)
+
+    def __iter__(self) -> Iterator[Tuple[List[str], List[str]]]:
+        stack, i = self.checkpoints[0]
+        stack = list(stack)
+        yield self._snapshot(stack, i)
+
+        for action in self.actions:
+            i = self._replay(stack, i, action)
+            yield self._snapshot(stack, i)
+
+    def _replay(self, stack: List[int], i: int, action: int) -> int:
+        table = self.table
+        if action == self.SHIFT:
+            a = table.actions[table.rows[stack[-1]] + table.tokens[self.tokens[i]]]
+            stack.append(a - 1)
+            return i + 1
+
+        if table.lengths[action]:
+            del stack[-table.lengths[action]:]
+        stack.append(table.gotos[table.goto_rows[stack[-1]] + table.heads[action]])
+        return i
+
+    def _snapshot(self, stack: List[int], i: int) -> Tuple[List[str], List[str]]:
+        accessing = self.table.accessing
+        return self.tokens[i:], [accessing[s] for s in stack[1:]]
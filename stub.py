@@ -7,20 +7,23 @@ def non_terminals(grammar):
 
 def as_proper(grammar):
     grammar = grammar.epsilon_free()
-    grammar = grammar.without_infertile()
+    grammar = grammar.reduced().grammar
     return grammar
 
 
 def first(grammar):
-    return {s: grammar.first(s) for s in grammar.nonterminals}
+    analysis = grammar.analysis()
+    return {s: set(analysis.first[s]) for s in grammar.nonterminals}
 
 
 def follow(grammar):
-    return {s: grammar.follow(s) for s in grammar.nonterminals}
+    analysis = grammar.analysis()
+    return {s: set(analysis.follow[s]) for s in grammar.nonterminals}
 
 
 def first_nt(grammar):
-    return {s: grammar.first_nonterminal(s) for s in grammar.nonterminals}
+    analysis = grammar.analysis()
+    return {s: set(analysis.first_nt[s]) for s in grammar.nonterminals}
 
 
 def build_parse_table(grammar):
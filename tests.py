@@ -1,8 +1,20 @@
 import unittest
 
 import io
+import json
+import os
+import pickle
+import subprocess
+import sys
+import tempfile
+from contextlib import redirect_stderr, redirect_stdout
 
-from cfg import CFG
+import bench
+import cli
+import codegen
+from cfg import CFG, Conflict, Diagnostics, ParseResult, instrument, tokenize
+from compiled import GrammarCache, load as load_compiled
+from cyk import numpy as cyk_numpy
 
 
 class CFGTest(unittest.TestCase):
@@ -94,6 +106,20 @@ class CFGTest(unittest.TestCase):
         self.assertSetEqual({'A', 'C'}, cfg.first_nonterminal('B'))
         self.assertSetEqual({'&'}, cfg.first_nonterminal('C'))
 
+        # going through many symbols builds the whole closure once
+        n = 1024
+        productions = {f'N{i}': {f'N{(i + 1) % n} a', 'b'} for i in range(n)}
+        cfg = CFG.create(initial_symbol='N0', productions=productions)
+        analysis = cfg.analysis()
+        cycle = set(productions)
+
+        self.assertSetEqual(cycle, cfg.first_nonterminal('N0'))
+        self.assertIsNone(analysis._closed)
+        for x in productions:
+            self.assertSetEqual(cycle, cfg.first_nonterminal(x))
+        self.assertIsNotNone(analysis._closed)
+        self.assertEqual([sorted(cycle)], cfg.ll1_report().left_recursion)
+
     def test_follow(self):
         cfg = CFG.create(
             initial_symbol='S',
@@ -158,6 +184,241 @@ class CFGTest(unittest.TestCase):
         self.assertSetEqual({'$', 'a', 'b'}, cfg.follow('A'))
         self.assertSetEqual({'$', 'a', 'b'}, cfg.follow('B'))
 
+    def test_analysis(self):
+        cfg = CFG.create(
+            initial_symbol='S',
+            productions={
+                'S': {'A', 'c A a'},
+                'A': {'S b', '&'},
+            },
+        )
+
+        analysis = cfg.analysis()
+        self.assertSetEqual({'S', 'A'}, analysis.nullable)
+        self.assertDictEqual({
+            'S': {'b', 'c', '&'},
+            'A': {'b', 'c', '&'},
+        }, analysis.first)
+        self.assertDictEqual({
+            'S': {'b', '$'},
+            'A': {'a', 'b', '$'},
+        }, analysis.follow)
+        self.assertDictEqual({
+            'S': {'S', 'A', '&'},
+            'A': {'S', 'A', '&'},
+        }, analysis.first_nt)
+
+        self.assertSetEqual({'b', 'c'}, analysis.first_of(['A', 'b']))
+        self.assertSetEqual({'b', 'c', '&'}, analysis.first_of(['S', 'A']))
+
+    def test_instrument(self):
+        cfg = CFG.create(
+            initial_symbol='E',
+            productions={
+                'E': {"T E'"},
+                "E'": {"+ T E'", '&'},
+                'T': {"F T'"},
+                "T'": {"* F T'", '&'},
+                'F': {'( E )', 'id'}
+            },
+        )
+
+        with instrument() as report:
+            cfg.parse_table()
+            cfg.parse_table()
+            self.assertTrue(cfg.recognize('id + id * id'))
+            self.assertFalse(cfg.recognize('id +'))
+            cfg.trace('( id )')
+
+        for phase in ('analysis', 'nullable', 'first', 'follow', 'parse_table', 'compiled_table'):
+            self.assertEqual(1, report.phases[phase].calls)
+        self.assertEqual(3, report.phases['parse'].calls)
+        self.assertGreater(report.phases['follow'].unions, 0)
+        self.assertGreater(report.depth, 0)
+        self.assertEqual(5 + 2 + 3, report.tokens)
+        self.assertEqual(report.tokens + report.expansions, report.steps)
+        self.assertIn('parse_table', report.summary())
+
+        # nothing is recorded outside of instrument()
+        cfg.trace('id')
+        self.assertEqual(3, report.phases['parse'].calls)
+
+    def test_interned(self):
+        cfg = CFG.create(
+            initial_symbol='S',
+            productions={
+                'S': {'A a', 'b'},
+                'A': {'a A', '&'},
+            },
+        )
+
+        productions = cfg.interned()
+        ids = productions.symbols.ids
+        self.assertEqual(0, ids['$'])
+        self.assertEqual(ids['S'], productions.initial)
+        self.assertEqual(['A a', 'b', '&', 'a A'], productions.sources)
+        self.assertEqual([(ids['A'], ids['a']), (ids['b'],), (), (ids['a'], ids['A'])], productions.bodies)
+        self.assertIs(productions, cfg.interned())
+
+    def test_analysis_cache(self):
+        cfg = CFG.create(
+            initial_symbol='S',
+            productions={
+                'S': {'A a A b'},
+                'A': {'c', '&'},
+            },
+        )
+
+        self.assertSetEqual({'a', 'c'}, cfg.first('S'))
+        self.assertSetEqual({'a', 'b'}, cfg.follow('A'))
+        cfg.is_ll1()
+        cfg.parse_table()
+        cfg.parse_table()
+        self.assertEqual(4, cfg.cache.misses)
+        self.assertEqual(6, cfg.cache.hits)
+
+        cfg.productions['A'] = {'d'}
+        cfg.invalidate()
+        self.assertSetEqual({'d'}, cfg.first('S'))
+        self.assertEqual(1, cfg.cache.version)
+        self.assertSetEqual({'a', 'b', 'd'}, cfg.terminals)
+        self.assertDictEqual({('S', 'd'): 'A a A b', ('A', 'd'): 'd'}, cfg.parse_table())
+        self.assertTrue(cfg.recognize('d a d b'))
+        self.assertFalse(cfg.recognize('c a c b'))
+
+        cfg.productions['B'] = {'b'}
+        cfg.productions['S'] = {'A a B'}
+        cfg.invalidate()
+        self.assertSetEqual({'S', 'A', 'B'}, cfg.nonterminals)
+        self.assertTrue(cfg.compiled_table().recognize('d a b'.split()))
+
+        cfg = CFG.create(
+            initial_symbol='S',
+            productions={
+                'S': {'A a A b'},
+                'A': {'c', '&'},
+            },
+        )
+        self.assertSetEqual({'&'}, cfg.first_nonterminal('A'))
+        self.assertSetEqual(set(), cfg.epsilon_free().first_nonterminal('A'))
+        self.assertSetEqual({'&'}, cfg.first_nonterminal('A'))
+
+    def test_reanalyze(self):
+        productions = {
+            'E': {"T E'"},
+            "E'": {"+ T E'", '&'},
+            'T': {"F T'"},
+            "T'": {"* F T'", '&'},
+            'F': {'( E )', 'id'}
+        }
+        previous = CFG.create(
+            initial_symbol='E',
+            productions={k: set(v) for k, v in productions.items()},
+        )
+        previous.parse_table()
+
+        productions["T'"] = {"* F T'", '/ F T\'', '&'}
+        productions['F'] = {'( E )', 'id', 'num'}
+        cfg = CFG.create(initial_symbol='E', productions=productions)
+        fresh = CFG.create(
+            initial_symbol='E',
+            productions={k: set(v) for k, v in productions.items()},
+        )
+
+        self.assertEqual(fresh.analysis(), cfg.reanalyze(previous))
+        self.assertDictEqual(fresh.parse_table(), cfg.parse_table())
+        self.assertEqual(0, cfg.cache.misses)
+
+        # a cell claimed by several productions goes to the last one in
+        # sorted order, however the sets were built
+        previous = CFG.create(initial_symbol='S', productions={'S': {'a', '&'}, 'A': {'&'}})
+        previous.parse_table()
+        productions = {'S': {'a', '&'}, 'A': {'&'}}
+        productions['S'].add('A a b')
+        cfg = CFG.create(initial_symbol='S', productions=productions)
+        cfg.reanalyze(previous)
+        fresh = CFG.create(
+            initial_symbol='S',
+            productions={k: set(sorted(v, reverse=True)) for k, v in productions.items()},
+        )
+        self.assertDictEqual(fresh.parse_table(), cfg.parse_table())
+        self.assertEqual('a', cfg.parse_table()[('S', 'a')])
+
+        previous = CFG.create(
+            initial_symbol='S',
+            productions={
+                'S': {'A B'},
+                'A': {'a A', '&'},
+                'B': {'b'},
+            },
+        )
+        previous.analysis()
+        cfg = CFG.create(
+            initial_symbol='S',
+            productions={
+                'S': {'A B'},
+                'A': {'a A', '&'},
+                'B': {'b', 'c'},
+            },
+        )
+
+        analysis = cfg.reanalyze(previous)
+        self.assertSetEqual({'a', 'b', 'c'}, analysis.first['S'])
+        self.assertSetEqual({'b', 'c'}, analysis.follow['A'])
+        # sets that cannot have changed are shared with the previous analysis
+        a = cfg.interned().symbols.ids['A']
+        self.assertIs(previous.analysis()._first[a], analysis._first[a])
+
+    def test_deep_chain(self):
+        # far deeper than the recursion limit
+        n = 3 * sys.getrecursionlimit()
+        productions = {f'N{i}': {f'N{i + 1} a', '&'} for i in range(n)}
+        productions[f'N{n}'] = {'b'}
+        cfg = CFG.create(initial_symbol='N0', productions=productions)
+
+        self.assertSetEqual({'a', 'b', '&'}, cfg.first('N0'))
+        self.assertSetEqual({'a'}, cfg.follow(f'N{n - 1}'))
+        self.assertEqual(n + 1, len(cfg.first_nonterminal('N0')))
+        self.assertFalse(cfg.is_ll1())
+        self.assertEqual(cfg, cfg.without_infertile())
+
+        productions = {f'N{i}': {f'N{i + 1} a'} for i in range(n)}
+        productions[f'N{n}'] = {'c'}
+        cfg = CFG.create(initial_symbol='N0', productions=productions)
+        self.assertTrue(cfg.is_ll1())
+        self.assertTrue(cfg.recognize('c' + ' a' * n))
+
+        productions[f'N{n}'] = {'N0 c'}
+        cfg = CFG.create(initial_symbol='N0', productions=productions)
+        self.assertFalse(cfg.is_ll1())
+
+        # infertility flows back through the whole chain
+        productions[f'N{n}'] = {f'N{n} c'}
+        productions[f'N{n // 2}'].add('d')
+        cfg = CFG.create(initial_symbol='N0', productions=productions)
+        self.assertEqual(n // 2 + 1, len(cfg.without_infertile().nonterminals))
+
+    def test_large_alphabet(self):
+        # sets spanning thousands of terminals, sparse and dense
+        n = 3000
+        cfg = CFG.create(
+            initial_symbol='S',
+            productions={
+                'S': {'A B', 'x S'},
+                'A': {f't{i}' for i in range(n)} | {'&'},
+                'B': {f'u{i} A' for i in range(0, n, 500)},
+            },
+        )
+
+        terminals = {f't{i}' for i in range(n)}
+        self.assertSetEqual(terminals | {'&'}, cfg.first('A'))
+        self.assertSetEqual(terminals | {f'u{i}' for i in range(0, n, 500)} | {'x'}, cfg.first('S'))
+        self.assertSetEqual({'$'} | {f'u{i}' for i in range(0, n, 500)}, cfg.follow('A'))
+        self.assertSetEqual(cfg.follow('A'), cfg.analysis().follow['A'])
+        self.assertTrue(cfg.is_ll1())
+        self.assertEqual(2 * (n + 7) + 6, len(cfg.parse_table()))
+        self.assertTrue(cfg.recognize('x t7 u500 t2999'))
+
     def test_is_ll1(self):
         cfg = CFG.create(
             initial_symbol='S',
@@ -168,6 +429,73 @@ class CFGTest(unittest.TestCase):
 
         self.assertFalse(cfg.is_ll1())
 
+        # stops early, without building the report, and agrees with it
+        grammars = [
+            {'S': {'a S a', 'b S b', 'a', 'b'}},
+            {'S': {'A a'}, 'A': {'a A', '&'}},
+            {'S': {'A b'}, 'A': {'a A', '&'}},
+            {'S': {'A a'}, 'A': {'B'}, 'B': {'c', '&'}},
+            {'S': {'A', 'B'}, 'A': {'&'}, 'B': {'&'}},
+            {'S': {'S a', 'b'}},
+            {'S': {'A b'}, 'A': {'B a'}, 'B': {'A c', 'd'}},
+            {'E': {'T E2'}, 'E2': {'+ T E2', '&'}, 'T': {'( E )', 'id'}},
+        ]
+        for productions in grammars:
+            initial = 'E' if 'E' in productions else 'S'
+            cfg = CFG.create(initial_symbol=initial, productions=productions)
+            report = CFG.create(initial_symbol=initial, productions=productions).ll1_report()
+            with self.subTest(productions=productions):
+                self.assertEqual(report.is_ll1, cfg.is_ll1())
+                self.assertIsNone(cfg.cache.peek('ll1_report'))
+
+    def test_ll1_report(self):
+        cfg = CFG.create(
+            initial_symbol='E',
+            productions={
+                'E': {'E + T', 'T'},
+                'T': {'id', 'if'},
+            },
+        )
+        report = cfg.ll1_report()
+        self.assertEqual([['E']], report.left_recursion)
+        self.assertEqual(
+            [
+                Conflict('E', 'id', 'FIRST/FIRST', ('E + T', 'T')),
+                Conflict('E', 'if', 'FIRST/FIRST', ('E + T', 'T')),
+            ],
+            report.conflicts,
+        )
+        self.assertFalse(report.is_ll1)
+
+        cfg = CFG.create(
+            initial_symbol='S',
+            productions={
+                'S': {'A a', 'B'},
+                'A': {'a A', '&'},
+                'B': {'A b', 'c'},
+            },
+        )
+        report = cfg.ll1_report()
+        self.assertEqual([], report.left_recursion)
+        self.assertEqual(
+            [
+                Conflict('A', 'a', 'FIRST/FOLLOW', ('&', 'a A')),
+                Conflict('S', 'a', 'FIRST/FIRST', ('A a', 'B')),
+            ],
+            report.conflicts,
+        )
+        self.assertIn('FIRST/FOLLOW conflict at (A, a): & | a A', str(report))
+
+        # symbols sharing their first character are no conflict
+        cfg = CFG.create(
+            initial_symbol='S',
+            productions={
+                'S': {'id', 'if S'},
+            },
+        )
+        self.assertTrue(cfg.is_ll1())
+        self.assertEqual('LL(1)', str(cfg.ll1_report()))
+
     def test_parse_table(self):
         cfg = CFG.create(
             initial_symbol='E',
@@ -227,6 +555,114 @@ class CFGTest(unittest.TestCase):
         with self.assertRaises(StopIteration):
             next(parse)
 
+    def test_compiled_table(self):
+        cfg = CFG.create(
+            initial_symbol='E',
+            productions={
+                'E': {"T E'"},
+                "E'": {"+ T E'", '&'},
+                'T': {"F T'"},
+                "T'": {"* F T'", '&'},
+                'F': {'( E )', 'id'}
+            },
+        )
+
+        table = cfg.compiled_table()
+        self.assertEqual(['(', ')', '*', '+', 'id', '$'], table.symbols[:table.n_terminals])
+        for (x, t), p in cfg.parse_table().items():
+            self.assertEqual(p, table.lookup(x, t))
+        self.assertIsNone(table.lookup('F', '+'))
+        self.assertIsNone(table.lookup('id', 'id'))
+
+        steps = list(cfg.parse('( id ) * id', table=table))
+        self.assertTupleEqual((['(', 'id', ')', '*', 'id'], ['E']), steps[0])
+        self.assertTupleEqual(([], []), steps[-1])
+
+        with self.assertRaises(ValueError):
+            list(cfg.parse('id + x', table=table))
+
+        with self.assertRaises(ValueError):
+            list(cfg.parse('id id', table=table))
+
+    def test_trace(self):
+        cfg = CFG.create(
+            initial_symbol='E',
+            productions={
+                'E': {"T E'"},
+                "E'": {"+ T E'", '&'},
+                'T': {"F T'"},
+                "T'": {"* F T'", '&'},
+                'F': {'( E )', 'id'}
+            },
+        )
+
+        trace = cfg.trace('( id + id ) * id', interval=3)
+        steps = list(trace)
+        self.assertTrue(trace.accepted)
+        self.assertEqual(len(steps), len(trace))
+        self.assertEqual((len(trace) - 1) // 3 + 1, len(trace.checkpoints))
+        self.assertListEqual(steps, [trace[i] for i in range(len(trace))])
+        self.assertListEqual(steps, list(cfg.parse('( id + id ) * id')))
+        self.assertTupleEqual(([], []), trace[-1])
+
+        trace = cfg.trace('id + )')
+        self.assertFalse(trace.accepted)
+        self.assertEqual('there is no (T, )) in parse table', trace.error)
+        self.assertTupleEqual(([')'], ["E'", 'T']), trace[-1])
+
+    def test_recognize(self):
+        cfg = CFG.create(
+            initial_symbol='E',
+            productions={
+                'E': {"T E'"},
+                "E'": {"+ T E'", '&'},
+                'T': {"F T'"},
+                "T'": {"* F T'", '&'},
+                'F': {'( E )', 'id'}
+            },
+        )
+
+        self.assertTrue(cfg.recognize('id + id * id'))
+        self.assertTrue(cfg.recognize(iter(['(', 'id', ')'])))
+        self.assertFalse(cfg.recognize('id +'))
+        self.assertFalse(cfg.recognize('id id'))
+        self.assertFalse(cfg.recognize('id $'))
+        self.assertFalse(cfg.recognize('E'))
+        self.assertFalse(cfg.recognize(''))
+
+        buf = io.StringIO(' + '.join(['( id * id )'] * 1000) + '\n')
+        self.assertTrue(cfg.recognize(tokenize(buf, chunk_size=7)))
+
+        buf = io.StringIO('id\n+ id  id')
+        self.assertListEqual(['id', '+', 'id', 'id'], list(tokenize(buf, chunk_size=3)))
+
+    def test_parse_many(self):
+        cfg = CFG.create(
+            initial_symbol='E',
+            productions={
+                'E': {"T E'"},
+                "E'": {"+ T E'", '&'},
+                'T': {"F T'"},
+                "T'": {"* F T'", '&'},
+                'F': {'( E )', 'id'}
+            },
+        )
+
+        sentences = ['id + id', 'id + * id', ['(', 'id'], 'id x', 'id']
+        expected = [
+            ParseResult(True),
+            ParseResult(False, 2, 'T', '*'),
+            ParseResult(False, 2, ')', '$'),
+            ParseResult(False, 1, "T'", 'x'),
+            ParseResult(True),
+        ]
+
+        self.assertListEqual(expected, list(cfg.parse_many(sentences)))
+        self.assertListEqual(
+            expected * 3,
+            list(cfg.parse_many(sentences * 3, processes=2, chunksize=4)),
+        )
+
     def test_without_infertile(self):
         cfg = CFG.create(
             initial_symbol='S',
@@ -256,6 +692,52 @@ class CFGTest(unittest.TestCase):
             'A': {'c', '&'},
         }, fertile.productions)
 
+    def test_reduced(self):
+        cfg = CFG.create(
+            initial_symbol='S',
+            productions={
+                'S': {'a A', 'b B', 'c'},
+                'A': {'a A'},
+                'B': {'b'},
+                'C': {'c C', 'c'},
+                'D': {'A d'},
+            },
+        )
+
+        reduced = cfg.reduced()
+        self.assertEqual('S', reduced.grammar.initial_symbol)
+        self.assertDictEqual({
+            'S': {'b B', 'c'},
+            'B': {'b'},
+        }, reduced.grammar.productions)
+        self.assertDictEqual({
+            'A': 'infertile',
+            'C': 'unreachable',
+            'D': 'infertile',
+        }, reduced.removed)
+
+        # E is only reachable through a production that is dropped
+        cfg = CFG.create(
+            initial_symbol='S',
+            productions={
+                'S': {'A E', 'a'},
+                'A': {'a A'},
+                'E': {'e'},
+            },
+        )
+        reduced = cfg.reduced()
+        self.assertDictEqual({'S': {'a'}}, reduced.grammar.productions)
+        self.assertDictEqual({'A': 'infertile', 'E': 'unreachable'}, reduced.removed)
+
+        deep = CFG.create('N0', {
+            **{f'N{i}': {f'a N{i + 1}', f'N{i + 1} N20000', 'c'} for i in range(20000)},
+            'N20000': {'z N20000'},
+        })
+        reduced = deep.reduced()
+        self.assertDictEqual({'N20000': 'infertile'}, reduced.removed)
+        self.assertEqual(20000, len(reduced.grammar.productions))
+        self.assertEqual({'a N1', 'c'}, reduced.grammar.productions['N0'])
+
     def test_epsilon_free(self):
         cfg = CFG.create(
             initial_symbol='S',
@@ -280,11 +762,233 @@ class CFGTest(unittest.TestCase):
         )
 
         epsilon_free = cfg.epsilon_free()
-        self.assertEqual("S'", epsilon_free.initial_symbol)
+        self.assertEqual('S', epsilon_free.initial_symbol)
         self.assertDictEqual({
-            "S'": {'S', '&'},
+            'S': {'&'},
         }, epsilon_free.productions)
 
+        productions = {
+            'S': {'opt opt end', "S' x"},
+            "S'": {'x'},
+            'opt': {'val', '&'},
+        }
+        cfg = CFG.create(initial_symbol='S', productions=productions)
+
+        epsilon_free = cfg.epsilon_free()
+        self.assertEqual('S', epsilon_free.initial_symbol)
+        self.assertDictEqual({
+            'S': {'opt opt end', 'opt end', 'end', "S' x"},
+            "S'": {'x'},
+            'opt': {'val'},
+        }, epsilon_free.productions)
+        self.assertEqual({'val', '&'}, cfg.productions['opt'])
+
+        cfg = CFG.create(initial_symbol='S', productions={'S': {'opt S', '&'}, "S'": {'x'}, 'opt': {'&', 'o'}})
+        epsilon_free = cfg.epsilon_free()
+        self.assertEqual("S''", epsilon_free.initial_symbol)
+        self.assertEqual({'S', '&'}, epsilon_free.productions["S''"])
+        self.assertEqual({'opt S', 'opt'}, epsilon_free.productions['S'])
+
+        # a run of k nullable symbols gives k + 1 bodies, not 2^k to sort out
+        cfg = CFG.create(initial_symbol='S', productions={'S': {' '.join(['A'] * 20 + ['b'])}, 'A': {'a', '&'}})
+        self.assertEqual(21, len(cfg.epsilon_free().productions['S']))
+
+        # nonterminals deriving only the empty sentence leave no trace
+        # behind, so both grammars accept the same sentences
+        grammars = [
+            {'S': {'b b A', '&'}, 'A': {'&'}},
+            {'S': {'A B a', 'B'}, 'A': {'B B', '&'}, 'B': {'A', 'C'}, 'C': {'C c', '&'}},
+            {'S': {'a S b', 'E S', 'E', 'D d'}, 'E': {'E E', '&', 'D d'}, 'D': {'D'}},
+        ]
+        for productions in grammars:
+            cfg = CFG.create(initial_symbol='S', productions=productions)
+            epsilon_free = cfg.epsilon_free()
+            with self.subTest(productions=productions):
+                self.assertLessEqual(epsilon_free.terminals, cfg.terminals)
+                for p in (p for x in epsilon_free.productions.values() for p in x):
+                    self.assertTrue(p == '&' or '&' not in p.split())
+
+                sentences = [[]]
+                for sentence in sentences:
+                    if len(sentence) < 4:
+                        sentences.extend(sentence + [t] for t in sorted(cfg.terminals))
+                for sentence in sentences:
+                    self.assertEqual(
+                        cfg.earley().recognize(sentence),
+                        epsilon_free.earley().recognize(sentence),
+                        sentence,
+                    )
+
+    def test_cnf(self):
+        cfg = CFG.create(
+            initial_symbol='S',
+            productions={
+                'S': {'a S b', 'S S', 'A', '&'},
+                'A': {'c A d', 'c d'},
+                'B': {'b'},
+            },
+        )
+
+        cnf = cfg.cnf()
+        self.assertEqual("S'", cnf.initial_symbol)
+        self.assertIn('&', cnf.productions["S'"])
+        self.assertNotIn('B', cnf.nonterminals)
+        for x, productions in cnf.productions.items():
+            for p in productions:
+                body = p.split()
+                if p == '&':
+                    self.assertEqual("S'", x)
+                elif len(body) == 1:
+                    self.assertIn(body[0], cnf.terminals)
+                else:
+                    self.assertEqual(2, len(body))
+                    self.assertTrue(set(body) <= cnf.nonterminals - {"S'"})
+
+    def test_cyk(self):
+        cfg = CFG.create(
+            initial_symbol='S',
+            productions={
+                'S': {'a S b', 'S S', '&'},
+            },
+        )
+        self.assertFalse(cfg.is_ll1())
+
+        cyk = cfg.cyk()
+        sentences = {
+            '': True,
+            'a b': True,
+            'a a b b a b': True,
+            'a b a b a a b b': True,
+            'a b b': False,
+            'b a': False,
+            'a a b': False,
+            'a c b': False,
+        }
+        for vectorized in (False, True):
+            if vectorized and cyk_numpy is None:
+                continue
+            for sentence, accepted in sentences.items():
+                with self.subTest(sentence=sentence, vectorized=vectorized):
+                    self.assertEqual(accepted, cyk.recognize(sentence.split(), vectorized=vectorized))
+
+        # against Earley, and LALR(1) where it has no conflicts, on grammars
+        # whose nonterminals derive only the empty sentence or nothing at
+        # all; their names are tried as tokens too
+        grammars = [
+            {'S': {'b b A', '&'}, 'A': {'&'}},
+            {'S': {'&'}},
+            {'S': {'A S B', 'a'}, 'A': {'A A', '&'}, 'B': {'b', 'A'}},
+            {'S': {'a S b', 'E S', 'E', 'D d'}, 'E': {'E E', '&', 'D d'}, 'D': {'D'}},
+            {'S': {'A b A', 'C'}, 'A': {'B B', '&'}, 'B': {'A'}, 'C': {'c C', 'A'}},
+        ]
+        for productions in grammars:
+            cfg = CFG.create(initial_symbol='S', productions=productions)
+            lalr = cfg.lalr_table()
+            tokens = sorted(cfg.terminals | cfg.nonterminals)
+            sentences = [[]]
+            for sentence in sentences:
+                if len(sentence) < 4:
+                    sentences.extend(sentence + [t] for t in tokens)
+
+            for sentence in sentences:
+                expected = cfg.parse_forest(sentence).accepted
+                with self.subTest(productions=productions, sentence=sentence):
+                    self.assertEqual(expected, cfg.cyk().recognize(sentence, vectorized=False))
+                    if cyk_numpy is not None:
+                        self.assertEqual(expected, cfg.cyk().recognize(sentence, vectorized=True))
+                    if not lalr.conflicts:
+                        self.assertEqual(expected, lalr.recognize(sentence))
+
+    def test_lalr(self):
+        cfg = CFG.create(
+            initial_symbol='E',
+            productions={
+                'E': {'E + T', 'T'},
+                'T': {'T * F', 'F'},
+                'F': {'( E )', 'id'},
+            },
+        )
+        self.assertFalse(cfg.is_ll1())
+        self.assertEqual([], cfg.lalr_table().conflicts)
+
+        steps = list(cfg.lalr_parse('id + id * id'))
+        self.assertEqual((['id', '+', 'id', '*', 'id'], []), steps[0])
+        self.assertEqual((['*', 'id'], ['E', '+', 'T']), steps[8])
+        self.assertEqual(([], ['E']), steps[-1])
+
+        trace = cfg.lalr_trace(' + '.join(['( id * id )'] * 1000), interval=16)
+        self.assertTrue(trace.accepted)
+        self.assertEqual(list(trace)[1234], trace[1234])
+
+        result = cfg.lalr_table().check('id + * id'.split())
+        self.assertEqual(ParseResult(False, 2, '+', '*'), result)
+        self.assertFalse(cfg.lalr_table().recognize('( id'.split()))
+        with self.assertRaises(ValueError):
+            list(cfg.lalr_parse('id id'))
+
+        # LALR(1) but not SLR(1)
+        cfg = CFG.create(
+            initial_symbol='S',
+            productions={
+                'S': {'L = R', 'R'},
+                'L': {'* R', 'id'},
+                'R': {'L'},
+            },
+        )
+        self.assertEqual([], cfg.lalr_table().conflicts)
+        self.assertTrue(cfg.lalr_table().recognize('* id = * * id'.split()))
+
+        cfg = CFG.create('E', {'E': {'E + E', 'id'}})
+        conflict, = cfg.lalr_table().conflicts
+        self.assertEqual(('+', 'shift/reduce'), (conflict.terminal, conflict.kind))
+        self.assertTrue(cfg.lalr_table().recognize('id + id + id'.split()))
+
+    def test_parse_forest(self):
+        cfg = CFG.create(
+            initial_symbol='E',
+            productions={
+                'E': {'E + E', 'E * E', 'id', '( E )'},
+            },
+        )
+        self.assertFalse(cfg.is_ll1())
+
+        forest = cfg.parse_forest('id + id * id')
+        self.assertTrue(forest.accepted)
+        self.assertEqual(2, forest.count())
+        self.assertCountEqual([
+            ('E', [('E', ['id']), '+', ('E', [('E', ['id']), '*', ('E', ['id'])])]),
+            ('E', [('E', [('E', ['id']), '+', ('E', ['id'])]), '*', ('E', ['id'])]),
+        ], list(forest.trees()))
+
+        # catalan(n - 1) trees, packed in a forest of polynomial size
+        forest = cfg.parse_forest(' + '.join(['id'] * 30))
+        self.assertEqual(1002242216651368, forest.count())
+        self.assertLess(len(forest), 100000)
+
+        forest = cfg.parse_forest('id + * id')
+        self.assertFalse(forest.accepted)
+        self.assertEqual(2, forest.position)
+        self.assertEqual(4, cfg.parse_forest('id + id +').position)
+        self.assertFalse(cfg.earley().recognize('( id'.split()))
+
+        cfg = CFG.create(
+            initial_symbol='S',
+            productions={
+                'S': {'A S b', 'a'},
+                'A': {'c', '&'},
+            },
+        )
+        forest = cfg.parse_forest('c a b b')
+        self.assertEqual(2, forest.count())
+        self.assertCountEqual([
+            ('S', [('A', ['c']), ('S', [('A', []), ('S', ['a']), 'b']), 'b']),
+            ('S', [('A', []), ('S', [('A', ['c']), ('S', ['a']), 'b']), 'b']),
+        ], list(forest.trees()))
+
+        cfg = CFG.create('S', {'S': {'S', 'a'}})
+        self.assertEqual(float('inf'), cfg.parse_forest('a').count())
+        self.assertEqual([('S', ['a'])], list(cfg.parse_forest('a').trees()))
+
     def test_load(self):
         buf = io.StringIO("""
             E -> T E'
@@ -315,5 +1019,262 @@ class CFGTest(unittest.TestCase):
             CFG.load(buf)
 
 
+    def test_load_file(self):
+        with tempfile.TemporaryDirectory() as directory:
+            def write(name, text):
+                with open(os.path.join(directory, name), 'w') as f:
+                    f.write(text)
+
+            write('main.cfg', 'E -> T E\'\ninclude terms.cfg\ninclude "factors.cfg"\n')
+            write('terms.cfg', "E' -> + T E' | &\nT -> F T'\nT' -> * F T' | &\n")
+            write('factors.cfg', 'F -> ( E )|id\nbad line\nF2 -> | x\ninclude main.cfg\n')
+
+            path = os.path.join(directory, 'main.cfg')
+            for processes in (None, 2):
+                diagnostics = Diagnostics()
+                cfg = CFG.load_file(path, diagnostics, processes=processes)
+                self.assertEqual('E', cfg.initial_symbol)
+                self.assertSetEqual({'( E )', 'id'}, cfg.productions['F'])
+                self.assertSetEqual({"+ T E'", '&'}, cfg.productions["E'"])
+                self.assertEqual(
+                    [2, 3, 4],
+                    [entry.line for entry in diagnostics],
+                )
+
+            diagnostics = Diagnostics(limit=1)
+            with open(os.path.join(directory, 'factors.cfg')) as f:
+                CFG.load(f, diagnostics)
+            self.assertEqual(1, len(diagnostics))
+            self.assertEqual(3, diagnostics.count)
+            self.assertEqual(2, diagnostics.dropped)
+            self.assertEqual(
+                f"{os.path.join(directory, 'factors.cfg')}:2: invalid line, skipping",
+                str(next(iter(diagnostics))),
+            )
+
+            # rules after includes that all fail are kept
+            write('missing.cfg', 'S -> a B\ninclude nowhere.cfg\nB -> b\n')
+            write('circular.cfg', 'S -> a B\ninclude circular.cfg\nB -> b\n')
+            for name in ('missing.cfg', 'circular.cfg'):
+                diagnostics = Diagnostics()
+                cfg = CFG.load_file(os.path.join(directory, name), diagnostics)
+                with self.subTest(name=name):
+                    self.assertDictEqual({'S': {'a B'}, 'B': {'b'}}, cfg.productions)
+                    self.assertSetEqual({'a', 'b'}, cfg.terminals)
+                    self.assertEqual([2], [entry.line for entry in diagnostics])
+
+    def test_grammar_cache(self):
+        with tempfile.TemporaryDirectory() as directory:
+            path = os.path.join(directory, 'main.cfg')
+            with open(path, 'w') as f:
+                f.write("E -> T E'\nE' -> + T E' | &\ninclude factors.cfg\nbad\n")
+            with open(os.path.join(directory, 'factors.cfg'), 'w') as f:
+                f.write('T -> ( E ) | id\n')
+
+            cache = GrammarCache(os.path.join(directory, 'cache'))
+            fresh = cache.load_file(path, Diagnostics())
+            diagnostics = Diagnostics()
+            cfg = cache.load_file(path, diagnostics)
+            self.assertEqual((1, 1), (cache.hits, cache.misses))
+            self.assertEqual([4], [entry.line for entry in diagnostics])
+
+            # loaded parse-ready, with nothing left to compute
+            self.assertEqual(fresh, cfg)
+            self.assertEqual(fresh.analysis(), cfg.analysis())
+            self.assertTrue(cfg.is_ll1())
+            self.assertTrue(cfg.recognize('( id + id ) + id'))
+            self.assertEqual(0, cfg.cache.misses)
+            self.assertDictEqual(fresh.parse_table(), cfg.parse_table())
+
+            # its table, over the mapped file, still goes to worker processes
+            table = pickle.loads(pickle.dumps(cfg.compiled_table()))
+            self.assertEqual(list(cfg.compiled_table().cells), list(table.cells))
+            self.assertTrue(table.recognize('( id + id ) + id'.split()))
+
+            # an edited include makes the entry stale
+            with open(os.path.join(directory, 'factors.cfg'), 'w') as f:
+                f.write('T -> ( E ) | num\n')
+            self.assertSetEqual({'( E )', 'num'}, cache.load_file(path).productions['T'])
+            self.assertEqual(2, cache.misses)
+
+            # so does a damaged entry
+            entry = os.path.join(cache.directory, os.listdir(cache.directory)[0])
+            with open(entry, 'r+b') as f:
+                f.write(b'XXXX')
+            with self.assertRaises(ValueError):
+                load_compiled(entry)
+            self.assertSetEqual({'( E )', 'num'}, cache.load_file(path).productions['T'])
+            self.assertEqual(3, cache.misses)
+            load_compiled(entry)
+
+            # text being edited is built, never stored
+            entries = os.listdir(cache.directory)
+            cfg = cache.load_text('S -> a S | b\n', Diagnostics())
+            self.assertTrue(cfg.recognize('a a b'))
+            self.assertEqual(entries, os.listdir(cache.directory))
+            self.assertEqual(3, cache.misses)
+
+            # with includes found next to the file it is an edit of
+            diagnostics = Diagnostics()
+            cfg = cache.load_text("E -> T E'\nE' -> &\ninclude factors.cfg\n", diagnostics, source=path)
+            self.assertSetEqual({'( E )', 'num'}, cfg.productions['T'])
+            self.assertEqual(0, diagnostics.count)
+
+            # entries beyond max_bytes go, least recently used first
+            other = os.path.join(directory, 'other.cfg')
+            with open(other, 'w') as f:
+                f.write('S -> a S | b\n')
+            small = GrammarCache(os.path.join(directory, 'small'), max_bytes=os.path.getsize(entry))
+            small.load_file(other)
+            small.load_file(path)
+            self.assertEqual(1, len(os.listdir(small.directory)))
+            small.load_file(path)
+            self.assertEqual((1, 2), (small.hits, small.misses))
+
+            # a cache that cannot be written to is only skipped
+            broken = GrammarCache(os.path.join(path, 'cache'))
+            self.assertSetEqual({'( E )', 'num'}, broken.load_file(path).productions['T'])
+            self.assertEqual(1, broken.misses)
+
+            # the same source including files of the same name is another
+            # grammar in another directory
+            for name, body in (('d1', 'a'), ('d2', 'b')):
+                os.mkdir(os.path.join(directory, name))
+                with open(os.path.join(directory, name, 'g.cfg'), 'w') as f:
+                    f.write('include part.cfg\n')
+                with open(os.path.join(directory, name, 'part.cfg'), 'w') as f:
+                    f.write(f'S -> {body}\n')
+            self.assertSetEqual({'a'}, cache.load_file(os.path.join(directory, 'd1', 'g.cfg')).productions['S'])
+            self.assertSetEqual({'b'}, cache.load_file(os.path.join(directory, 'd2', 'g.cfg')).productions['S'])
+
+    def test_codegen(self):
+        cfg = CFG.create(*bench.expression(3))
+        long = bench.expression_sentence(3, 20000).split()
+
+        for style in codegen.STYLES:
+            with self.subTest(style=style):
+                source = codegen.generate(cfg, style)
+                self.assertNotIn('import', source)
+
+                module = codegen.load(source)
+                self.assertEqual([], codegen.verify(cfg, module))
+                self.assertTrue(module.recognize(long))
+                self.assertEqual(-1, module.check(['id']))
+                self.assertEqual(cfg.compiled_table().check(['(', 'id']).position, module.check(['(', 'id']))
+                self.assertEqual(1, module.check(['id', 'id']))
+
+        samples = list(codegen.sentences(cfg, count=200, seed=3))
+        self.assertTrue(any(cfg.recognize(s) for s in samples))
+        self.assertFalse(all(cfg.recognize(s) for s in samples))
+
+        with self.assertRaises(ValueError):
+            codegen.generate(CFG.create('E', {'E': {'E + id', 'id'}}))
+
+    def test_cli(self):
+        def run(*argv, stdin=''):
+            stdout = io.StringIO()
+            with redirect_stdout(stdout), redirect_stderr(io.StringIO()):
+                sys.stdin = io.StringIO(stdin)
+                try:
+                    status = cli.main(list(argv))
+                finally:
+                    sys.stdin = sys.__stdin__
+            return status, stdout.getvalue()
+
+        with tempfile.TemporaryDirectory() as directory:
+            path = os.path.join(directory, 'expression.cfg')
+            with open(path, 'w') as f:
+                f.write('\n'.join(bench.render(*bench.expression(1))))
+            cfg = CFG.load_file(path)
+
+            status, output = run('analyze', path)
+            analysis = json.loads(output)
+            self.assertEqual(0, status)
+            self.assertEqual(sorted(cfg.first('E0')), analysis['first']['E0'])
+            self.assertEqual(sorted(cfg.follow('E1')), analysis['follow']['E1'])
+            self.assertEqual(["&"], analysis['first_nt']["E0'"])
+
+            self.assertEqual((0, 'LL(1)\n'), run('ll1', path))
+            status, output = run('table', path)
+            self.assertEqual(cfg.parse_table()[('E1', '(')], json.loads(output)['E1']['('])
+
+            status, output = run('parse', path, stdin='id o0 ( id )\nid o0\n')
+            self.assertEqual((1, ['accepted', 'rejected at 2: end of input']), (status, output.splitlines()))
+            for method in cli.METHODS:
+                self.assertEqual(0, run('parse', '-m', method, path, stdin='( id ) o0 id\n')[0])
+
+            with open(path, 'w') as f:
+                f.write('S -> A b | S a\nA -> a A | &\nB -> b\n')
+            self.assertEqual(1, run('ll1', path)[0])
+            self.assertEqual(1, run('table', path)[0])
+            self.assertEqual(1, run('parse', '-m', 'll1', path, stdin='b\n')[0])
+            self.assertEqual((0, 'accepted\n'), run('parse', path, stdin='a b a\n'))
+
+            status, output = run('transform', path, 'proper')
+            self.assertEqual(0, status)
+            self.assertEqual(CFG.load(output.splitlines()), CFG.create('S', {
+                'S': {'A b', 'b', 'S a'},
+                'A': {'a A', 'a'},
+            }))
+            self.assertEqual(1, run('analyze', os.path.join(directory, 'missing.cfg'))[0])
+
+            here = os.path.dirname(os.path.abspath(__file__))
+            process = subprocess.run(
+                [sys.executable, '-m', 'cfg', 'parse', path],
+                input='a b a\nb b\n', cwd=here, capture_output=True, text=True,
+            )
+            self.assertEqual((1, "accepted\nrejected at 1: 'b'\n"), (process.returncode, process.stdout))
+
+            # every transform prints a grammar that loads back to the same
+            # language, nonterminals left with no rule included
+            with open(path, 'w') as f:
+                f.write('S -> A b | a | E S c\nA -> A\nE -> E E | &\n')
+            cfg = CFG.load_file(path)
+            for transform in cli.TRANSFORMS:
+                status, output = run('transform', path, transform)
+                transformed = CFG.load(output.splitlines())
+                with self.subTest(transform=transform):
+                    self.assertEqual(0, status)
+                    self.assertLessEqual(transformed.terminals, cfg.terminals)
+                    sentences = [[]]
+                    for sentence in sentences:
+                        if len(sentence) < 4:
+                            sentences.extend(sentence + [t] for t in ('a', 'b', 'c', 'A'))
+                    for sentence in sentences:
+                        self.assertEqual(
+                            cfg.earley().recognize(sentence),
+                            transformed.earley().recognize(sentence),
+                            sentence,
+                        )
+
+        # nothing but the standard library and cfg is loaded
+        loaded = subprocess.run(
+            [sys.executable, '-c', 'import sys, cli; print(sorted(sys.modules))'],
+            cwd=here, capture_output=True, text=True, check=True,
+        ).stdout
+        for module in ('PyQt5', 'numpy', 'lr', 'earley', 'cyk', 'concurrent'):
+            self.assertNotIn(f"'{module}'", loaded)
+
+    def test_bench(self):
+        for levels in (1, 3):
+            cfg = CFG.create(*bench.expression(levels))
+            self.assertTrue(cfg.is_ll1())
+            for length in (1, 10, 100):
+                self.assertTrue(cfg.recognize(bench.expression_sentence(levels, length)))
+
+        self.assertTrue(CFG.create(*bench.random_ll1(50, seed=1)).is_ll1())
+        self.assertEqual(
+            CFG.create(*bench.nullable_chain(3)),
+            CFG.load(bench.render(*bench.nullable_chain(3))),
+        )
+
+        self.assertEqual(
+            [('a', 0.010, 0.020)],
+            bench.compare(
+                {'a': 0.020, 'b': 0.0002, 'c': 0.011, 'd': 1.0},
+                {'a': 0.010, 'b': 0.0001, 'c': 0.010},
+            ),
+        )
+
 if __name__ == '__main__':
     unittest.main()